@@ -7,6 +7,9 @@ import traceback
 import re
 from typing import List, Dict, Any, Tuple, Optional
 
+# Cell values that should be right-aligned as numbers
+NUMERIC_CELL_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
 def detect_table_caption(text_before_table: str, page_num: int, max_chars_to_scan: int = 500) -> Optional[str]:
     """
     Detect and extract table caption from text preceding the table.
@@ -22,6 +25,10 @@ def detect_table_caption(text_before_table: str, page_num: int, max_chars_to_sca
     # Limit the text to scan for efficiency
     text_to_scan = text_before_table[-max_chars_to_scan:] if len(text_before_table) > max_chars_to_scan else text_before_table
     
+    # Every caption pattern starts with "Table"/"TABLE"; skip the regex scan when neither appears
+    if "Table" not in text_to_scan and "TABLE" not in text_to_scan:
+        return f"Extracted Table from Page {page_num}"
+    
     # Look for patterns like "Table 2-2: Description" or "Table 2.2 Description"
     caption_patterns = [
         r"Table\s+(\d+[-\.]\d+)[\s\:]+([^\n]+)",  # Table 2-2: Description
@@ -53,14 +60,30 @@ def _is_header_row(row: List[str]) -> bool:
     if not row:
         return False
     
-    # Check if all cells are non-empty and relatively short
-    non_empty = [cell for cell in row if cell and str(cell).strip()]
-    if len(non_empty) < len(row) * 0.7:  # At least 70% of cells should be non-empty
+    # Single pass over the row: count non-empty cells and their total length,
+    # bailing out once either header condition can no longer hold
+    max_empty = len(row) * 0.3  # At least 70% of cells should be non-empty
+    max_total_len = 25 * len(row)  # Headers are usually shorter than 25 chars
+    empty_count = 0
+    non_empty_count = 0
+    total_len = 0
+    for cell in row:
+        text = str(cell) if cell else ""
+        if not text.strip():
+            empty_count += 1
+            if empty_count > max_empty:
+                return False
+            continue
+        non_empty_count += 1
+        total_len += len(text)
+        if total_len >= max_total_len:
+            return False
+    
+    if not non_empty_count:
         return False
     
     # Check if cells are relatively short (headers tend to be concise)
-    avg_length = sum(len(str(cell)) for cell in non_empty) / len(non_empty) if non_empty else 0
-    return avg_length < 25  # Headers are usually shorter than 25 chars
+    return total_len / non_empty_count < 25
 
 def _generate_column_alignments(table: List[List[str]]) -> List[str]:
     """
@@ -78,19 +101,30 @@ def _generate_column_alignments(table: List[List[str]]) -> List[str]:
     num_cols = len(table[0])
     alignments = []
     
+    num_values = len(table) - 1
+    threshold = num_values * 0.7
+    
     # Check each column
     for col_idx in range(num_cols):
-        # Get column values (skip header)
-        col_values = [row[col_idx] if col_idx < len(row) else "" for row in table[1:]]
-        
-        # Check if column appears to be numeric
+        # Check if column appears to be numeric, stopping once the
+        # 70% threshold is either reached or no longer reachable
         numeric_count = 0
-        for val in col_values:
-            if val and re.match(r'^-?\d+(?:\.\d+)?$', str(val).strip()):
-                numeric_count += 1
+        remaining = num_values
+        for row in table[1:]:
+            remaining -= 1
+            val = row[col_idx] if col_idx < len(row) else ""
+            if val:
+                # Cells are already cleaned strings; only convert anything else
+                text = val if isinstance(val, str) else str(val).strip()
+                if NUMERIC_CELL_PATTERN.fullmatch(text):
+                    numeric_count += 1
+                    if numeric_count > threshold:
+                        break
+            if numeric_count + remaining <= threshold:
+                break
         
         # If more than 70% of values are numeric, right-align
-        if numeric_count > len(col_values) * 0.7:
+        if numeric_count > threshold:
             alignments.append("---:")
         else:
             alignments.append("---")
@@ -150,18 +184,20 @@ def convert_table_to_markdown(table: List[List[str]], caption: str = "") -> str:
     # Create data rows
     for row in cleaned_table[1:]:
         # Ensure row has the correct number of columns
-        while len(row) < num_cols:
-            row.append("")
+        missing = num_cols - len(row)
+        if missing > 0:
+            row = row + [""] * missing
         markdown_table += "| " + " | ".join(row[:num_cols]) + " |\n"
     
     # Add table metadata as HTML comment for post-processing
-    table_metadata = {
-        'caption': caption,
-        'has_header': has_header,
-        'num_rows': len(cleaned_table),
-        'num_cols': num_cols
-    }
-    markdown_table += f"\n<!-- TABLE_METADATA: {json.dumps(table_metadata)} -->\n"
+    # (fixed shape, so only the caption needs JSON escaping)
+    table_metadata = (
+        f'{{"caption": {json.dumps(caption)}, '
+        f'"has_header": {"true" if has_header else "false"}, '
+        f'"num_rows": {len(cleaned_table)}, '
+        f'"num_cols": {num_cols}}}'
+    )
+    markdown_table += f"\n<!-- TABLE_METADATA: {table_metadata} -->\n"
     
     return markdown_table
 
@@ -205,11 +241,11 @@ def extract_text_and_tables(pdf_path: str) -> Dict[str, Any]:
                 
                 # If tables were found, convert them to markdown and add to the text
                 if tables:
+                    # The caption scan only depends on the page text, so run it once per page
+                    table_caption = detect_table_caption(page_text, page_num)
+                    
                     for table_idx, table in enumerate(tables):
                         if table and len(table) > 0:
-                            # Look for table caption in the text before the table
-                            table_caption = detect_table_caption(page_text, page_num)
-                            
                             # Convert to markdown with caption
                             markdown_table = convert_table_to_markdown(table, table_caption)
                             
@@ -257,9 +293,29 @@ def process_pdf(pdf_path: str) -> Dict[str, Any]:
     # Extract text and tables
     return extract_text_and_tables(pdf_path)
 
+def serve(stream=sys.stdin) -> None:
+    """
+    Process PDF paths read line by line from stdin, writing one JSON result per line.
+    
+    Keeps a single interpreter alive so pdfplumber/pdfminer are imported once
+    and their font caches are reused across documents.
+    """
+    try:
+        import pdfplumber  # noqa: F401 - warm the import before the first request
+    except ImportError:
+        pass
+    
+    for line in stream:
+        pdf_path = line.strip()
+        if not pdf_path:
+            continue
+        print(json.dumps(process_pdf(pdf_path)), flush=True)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract text and tables from PDF using pdfplumber")
-    parser.add_argument("pdf_path", help="Path to the PDF file")
+    parser.add_argument("pdf_path", nargs="?", help="Path to the PDF file")
+    parser.add_argument("--server", action="store_true",
+                        help="Read PDF paths from stdin (one per line) and emit JSON lines")
     
     if len(sys.argv) < 2:
         print(json.dumps({
@@ -270,6 +326,17 @@ if __name__ == "__main__":
     
     args = parser.parse_args()
     
+    if args.server:
+        serve()
+        sys.exit(0)
+    
+    if not args.pdf_path:
+        print(json.dumps({
+            "success": False,
+            "error": "PDF path argument is required"
+        }))
+        sys.exit(1)
+    
     # Process the PDF and get the result
     result = process_pdf(args.pdf_path)
     
@@ -1,13 +1,36 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import pandas as pd
+import io
 import os
+import math
+import shutil
 import logging
 import numpy as np
 from enhanced_layout_generator import analyze_and_generate_advanced_layout
 from branch_analyzer import analyze_branch_view
 from rtl_analyzer import analyze_rtl_view
 
+# Faster readers are optional; fall back to pandas defaults when missing
+try:
+    import pyarrow
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    import python_calamine
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Set up logginghh
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,15 +41,24 @@ CORS(app)
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def convert_to_json_serializable(obj):
-    """Convert numpy/pandas types to JSON serializable types"""
+# Copy uploads in 1 MiB chunks rather than werkzeug's small default buffer
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Uploads up to this size are analyzed from memory instead of being written to disk
+IN_MEMORY_UPLOAD_LIMIT = 16 << 20
+
+def _convert_float(value):
+    return None if math.isnan(value) else value
+
+def _convert_other(obj):
+    """Slow path for types missing from the dispatch table"""
     if isinstance(obj, dict):
         return {key: convert_to_json_serializable(value) for key, value in obj.items()}
     elif isinstance(obj, list):
         return [convert_to_json_serializable(item) for item in obj]
-    elif isinstance(obj, (np.integer, np.int64, np.int32)):
+    elif isinstance(obj, np.integer):
         return int(obj)
-    elif isinstance(obj, (np.floating, np.float64, np.float32)):
+    elif isinstance(obj, np.floating):
         return float(obj)
     elif isinstance(obj, np.ndarray):
         return obj.tolist()
@@ -35,6 +67,72 @@ def convert_to_json_serializable(obj):
     else:
         return obj
 
+# Exact-type dispatch so common leaves skip the isinstance chain and pd.isna
+_JSON_CONVERTERS = {
+    dict: lambda obj: {key: convert_to_json_serializable(value) for key, value in obj.items()},
+    list: lambda obj: [convert_to_json_serializable(item) for item in obj],
+    str: lambda obj: obj,
+    int: lambda obj: obj,
+    bool: lambda obj: obj,
+    float: _convert_float,
+    type(None): lambda obj: None,
+    np.int64: int,
+    np.int32: int,
+    np.float64: float,
+    np.float32: float,
+    np.bool_: bool,
+    np.ndarray: lambda obj: obj.tolist(),
+}
+
+def convert_to_json_serializable(obj):
+    """Convert numpy/pandas types to JSON serializable types"""
+    converter = _JSON_CONVERTERS.get(type(obj))
+    if converter is not None:
+        return converter(obj)
+    return _convert_other(obj)
+
+def _to_serializable(obj):
+    """orjson default hook for the values OPT_SERIALIZE_NUMPY does not cover"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if pd.isna(obj):
+        return None
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def layout_response(layout_data):
+    """Serialize layout data in a single pass, falling back to jsonify without orjson"""
+    if HAS_ORJSON:
+        body = orjson.dumps(
+            layout_data,
+            default=_to_serializable,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+        return Response(body, mimetype='application/json')
+    return jsonify(convert_to_json_serializable(layout_data))
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, so every jsonify() response skips the stdlib encoder"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(
+            obj,
+            default=_to_serializable,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        ).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+if HAS_ORJSON:
+    app.json = ORJSONProvider(app)
+
+def save_upload(file, file_path):
+    """Stream an uploaded file to disk in large chunks"""
+    with open(file_path, 'wb') as out:
+        shutil.copyfileobj(file.stream, out, length=UPLOAD_CHUNK_SIZE)
+
 def read_data_file(file_path):
     """Read data from either CSV or Excel file based on extension - Model-based approach"""
     try:
@@ -42,9 +140,11 @@ def read_data_file(file_path):
         logger.info(f"Reading file with extension: {file_ext}")
         
         if file_ext == '.csv':
-            df = pd.read_csv(file_path)
+            # The pyarrow tokenizer is multi-threaded and much faster on large uploads
+            df = pd.read_csv(file_path, engine='pyarrow') if HAS_PYARROW else pd.read_csv(file_path)
         elif file_ext in ['.xls', '.xlsx']:
-            df = pd.read_excel(file_path)
+            # calamine (Rust) avoids openpyxl's per-cell Python objects
+            df = pd.read_excel(file_path, engine='calamine') if HAS_CALAMINE else pd.read_excel(file_path)
         else:
             raise ValueError("Unsupported file format. Please upload a CSV or Excel file.")
         
@@ -99,7 +199,7 @@ def upload_file():
         
         # Save file
         file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        file.save(file_path)
+        save_upload(file, file_path)
         logger.info(f"File saved to: {file_path}")
 
         try:
@@ -114,11 +214,8 @@ def upload_file():
                     'details': 'No valid layout data generated'
                 }), 500
             
-            # Convert numpy/pandas types to JSON serializable types
-            layout_data = convert_to_json_serializable(layout_data)
-            
             logger.info(f"Successfully generated layout with {len(layout_data['nodes'])} nodes")
-            return jsonify(layout_data)
+            return layout_response(layout_data)
 
         except ValueError as ve:
             logger.error(f"Validation error: {str(ve)}")
@@ -156,15 +253,20 @@ def upload_file_branch():
             
         logger.info(f"Processing file for branch view: {file.filename}")
         
-        # Save file
-        file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        file.save(file_path)
-        logger.info(f"File saved to: {file_path}")
+        # Small uploads are analyzed straight from memory; larger ones spill to disk
+        file_path = None
+        if request.content_length and request.content_length <= IN_MEMORY_UPLOAD_LIMIT:
+            source = io.BytesIO(file.read())
+        else:
+            file_path = os.path.join(UPLOAD_FOLDER, file.filename)
+            save_upload(file, file_path)
+            logger.info(f"File saved to: {file_path}")
+            source = file_path
 
         try:
             # Generate branch visualization
             logger.info("Analyzing data for branch view patterns...")
-            layout_data = analyze_branch_view(file_path)
+            layout_data = analyze_branch_view(source)
             
             if not layout_data or not layout_data.get("nodes"):
                 logger.error("Failed to generate valid branch layout")
@@ -173,11 +275,8 @@ def upload_file_branch():
                     'details': 'No valid branch layout data generated'
                 }), 500
             
-            # Convert numpy/pandas types to JSON serializable types
-            layout_data = convert_to_json_serializable(layout_data)
-            
             logger.info(f"Successfully generated branch layout with {len(layout_data['nodes'])} nodes")
-            return jsonify(layout_data)
+            return layout_response(layout_data)
 
         except ValueError as ve:
             logger.error(f"Branch analysis validation error: {str(ve)}")
@@ -190,11 +289,12 @@ def upload_file_branch():
             }), 500
         finally:
             # Clean up uploaded file
-            try:
-                os.remove(file_path)
-                logger.info(f"Cleaned up file: {file_path}")
-            except:
-                pass
+            if file_path:
+                try:
+                    os.remove(file_path)
+                    logger.info(f"Cleaned up file: {file_path}")
+                except:
+                    pass
 
     except Exception as e:
         logger.error(f"Unexpected error in branch upload: {str(e)}")
@@ -217,7 +317,7 @@ def upload_file_rtl():
         
         # Save file
         file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        file.save(file_path)
+        save_upload(file, file_path)
         logger.info(f"File saved to: {file_path}")
 
         try:
@@ -232,11 +332,8 @@ def upload_file_rtl():
                     'details': 'No valid RTL layout data generated'
                 }), 500
             
-            # Convert numpy/pandas types to JSON serializable types
-            layout_data = convert_to_json_serializable(layout_data)
-            
             logger.info(f"Successfully generated RTL layout with {len(layout_data.get('rtl_versions', []))} versions")
-            return jsonify(layout_data)
+            return layout_response(layout_data)
 
         except ValueError as ve:
             logger.error(f"RTL analysis validation error: {str(ve)}")
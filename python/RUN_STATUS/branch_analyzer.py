@@ -4,12 +4,17 @@ Analyzes data to detect when stages are copied from previous runs and creates br
 Treats header row as actual data (Run 1) and extracts username automatically
 """
 
+import os
+import sys
 import json
 import logging
+import itertools
+import functools
+import bisect
 import re
 import math
 import csv
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Union, BinaryIO, TextIO, Iterable
 import requests
 
 # Try to import pandas and openpyxl, use fallback if not available
@@ -22,11 +27,66 @@ except ImportError:
     pd = None
     openpyxl = None
 
+# python-calamine parses xlsx much faster than openpyxl when installed
+try:
+    import python_calamine
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
 logger = logging.getLogger(__name__)
 
 OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL = "mistral"
 
+# Runs of letters, used to strip digits/punctuation from run and stage names
+ALPHA_PATTERN = re.compile(r'[^\W\d_]+')
+
+# CSV files larger than this are read in chunks of CSV_CHUNK_ROWS rows
+LARGE_CSV_BYTES = 50 * 1024 * 1024
+CSV_CHUNK_ROWS = 100_000
+
+# Stage colors, matched as substrings of the lowercased stage name (first match wins)
+STAGE_COLORS = {
+    'floorplan': '#3498DB', 'floor': '#3498DB', 'fp': '#3498DB',
+    'place': '#2ECC71', 'placement': '#2ECC71', 'pl': '#2ECC71',
+    'cts': '#F39C12', 'clock': '#F39C12', 'ct': '#F39C12',
+    'route': '#E74C3C', 'routing': '#E74C3C', 'rt': '#E74C3C',
+    'drc': '#9B59B6', 'check': '#9B59B6', 'verify': '#9B59B6'
+}
+
+RUN_NUMBER_PATTERN = re.compile(r'\d+')
+
+@functools.lru_cache(maxsize=None)
+def extract_run_number(run_name: str) -> int:
+    """First number in a run name; the header row (no numbers) is treated as Run 0"""
+    match = RUN_NUMBER_PATTERN.search(run_name)
+    if not match:
+        return 0  # Header row comes first
+    return int(match.group())
+
+def normalize_cell(value: Any) -> str:
+    """Stripped string form of a cell, computed once per cell.
+    
+    Short values (status words, paths, ids) are interned so the many equality
+    checks in copy detection mostly compare identical objects.
+    """
+    if isinstance(value, str):
+        text = value.strip()
+    elif value is None:
+        return ''
+    else:
+        text = str(value).strip()
+    return sys.intern(text) if text and len(text) < 32 else text
+
+@functools.lru_cache(maxsize=1024)
+def get_stage_color(stage_lower: str) -> str:
+    """Color for a lowercased stage name; stage names repeat across runs, so results are cached"""
+    for pattern, color in STAGE_COLORS.items():
+        if pattern in stage_lower:
+            return color
+    return '#34495E'  # Default color
+
 class BranchViewAnalyzer:
     """Analyzes data for branching patterns based on copied data from previous stages"""
     
@@ -67,24 +127,36 @@ class BranchViewAnalyzer:
         """Main function to analyze data and generate branch view"""
         try:
             logger.info(f"Analyzing branch patterns for: {file_path}")
+            # Run names are file specific; don't let the sort-key cache grow across files
+            extract_run_number.cache_clear()
+            
+            row_chunks = None
             
             # Read data with fallback support
             if HAS_PANDAS and file_path.endswith(('.xlsx', '.xls')):
-                # Use pandas for Excel files
-                wb = openpyxl.load_workbook(file_path)
+                # Use pandas for Excel files - open the workbook once and read every cell as text
+                excel_file = pd.ExcelFile(file_path, engine='calamine' if HAS_CALAMINE else None)
                 sheets_data = {}
-                for sheet_name in wb.sheetnames:
-                    df = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
+                for sheet_name in excel_file.sheet_names:
+                    df = excel_file.parse(sheet_name, header=None, dtype=str)
                     df.columns = [f"col_{i}" for i in range(len(df.columns))]
                     for col in df.columns:
-                        if df[col].dtype == 'object':
-                            df[col] = df[col].astype(str).str.strip()
-                    df = df.dropna(how='all')
+                        df[col] = df[col].str.strip()
+                    df = df.dropna(how='all').fillna('')
                     if not df.empty:
                         sheets_data[sheet_name] = df
+            elif HAS_PANDAS and os.path.getsize(file_path) > LARGE_CSV_BYTES:
+                # Large CSV: stream fixed-size chunks so only one chunk of rows is in memory.
+                # The first chunk drives structure analysis; all chunks feed copy detection.
+                reader = pd.read_csv(file_path, header=None, dtype=str, keep_default_na=False,
+                                     engine='c', chunksize=CSV_CHUNK_ROWS)
+                chunks = (chunk.rename(columns=lambda i: f"col_{i}") for chunk in reader)
+                first_chunk = next(chunks)
+                sheets_data = {'main': first_chunk}
+                row_chunks = itertools.chain([first_chunk], chunks)
             elif HAS_PANDAS:
-                # Use pandas for CSV files - treat header as data
-                df = pd.read_csv(file_path, header=None)  # Don't treat first row as header
+                # Use pandas for CSV files - treat header as data, keep cells as raw text
+                df = pd.read_csv(file_path, header=None, dtype=str, keep_default_na=False, engine='c')
                 # Rename columns to positional names
                 df.columns = [f"col_{i}" for i in range(len(df.columns))]
                 sheets_data = {'main': df}
@@ -96,7 +168,7 @@ class BranchViewAnalyzer:
             data_analysis = self._analyze_data_structure(sheets_data)
             
             # Detect copy patterns
-            copy_patterns = self._detect_copy_patterns(sheets_data, data_analysis)
+            copy_patterns = self._detect_copy_patterns(sheets_data, data_analysis, row_chunks)
             
             # Generate branch layout
             branch_layout = self._generate_branch_layout(sheets_data, data_analysis, copy_patterns)
@@ -113,15 +185,21 @@ class BranchViewAnalyzer:
         # Get first sheet for analysis
         first_sheet_data = list(sheets_data.values())[0]
         
-        # Handle both pandas DataFrame and fallback dict format
+        # Handle both pandas DataFrame and fallback dict format.
+        # Only run names containing '_' can carry a username (e.g. s_girishR1).
         if HAS_PANDAS and hasattr(first_sheet_data, 'columns'):
             columns = first_sheet_data.columns.tolist()
-            all_data = first_sheet_data.to_dict('records')
+            # Read the run column and first row directly rather than copying every row into a dict
+            run_values = first_sheet_data.iloc[:, 0].astype(str)
+            candidates = run_values[run_values.str.contains('_', regex=False)].tolist()
+            first_row = first_sheet_data.iloc[0] if len(first_sheet_data) > 0 else None
         else:
             # Fallback: get columns from first row
             if first_sheet_data and len(first_sheet_data) > 0:
                 columns = list(first_sheet_data[0].keys())
-                all_data = first_sheet_data
+                run_values = (str(row.get(columns[0], '')) for row in first_sheet_data)
+                candidates = [value for value in run_values if '_' in value]
+                first_row = first_sheet_data[0]
             else:
                 raise ValueError("No data found in the file")
         
@@ -129,34 +207,28 @@ class BranchViewAnalyzer:
         
         # Extract username from ALL data rows (including header which is now Run 1)
         username = "Unknown User"
-        if all_data and len(all_data) > 0:
-            # Try to extract username from any run name in the data
-            for row in all_data:
-                row_value = str(row.get(columns[0], ''))
-                if '_' in row_value and 'R' in row_value:  # Look for pattern like s_girishR1
-                    parts = row_value.split('_')
-                    if len(parts) >= 2:
-                        username_part = parts[1]
-                        # Extract alphabetic part before 'R' (e.g., girishR1 -> girish)
-                        if 'R' in username_part:
-                            username = username_part.split('R')[0]  # Take part before 'R'
-                        else:
-                            username = ''.join([c for c in username_part if c.isalpha()])
-                        if username and len(username) > 1:
-                            break
-            
-            # If still no username found, try simpler patterns
-            if not username or username == "Unknown User":
-                for row in all_data:
-                    row_value = str(row.get(columns[0], ''))
-                    if '_' in row_value:
-                        parts = row_value.split('_')
-                        if len(parts) >= 2 and len(parts[1]) > 1:
-                            # Take the second part and remove numbers
-                            username_part = parts[1]
-                            username = ''.join([c for c in username_part if c.isalpha()])
-                            if username and len(username) > 1:
-                                break
+        
+        # Try to extract username from any run name in the data
+        for row_value in candidates:
+            if 'R' in row_value:  # Look for pattern like s_girishR1
+                username_part = row_value.split('_', 2)[1]
+                # Extract alphabetic part before 'R' (e.g., girishR1 -> girish)
+                if 'R' in username_part:
+                    username = username_part.partition('R')[0]  # Take part before 'R'
+                else:
+                    username = ''.join(ALPHA_PATTERN.findall(username_part))
+                if username and len(username) > 1:
+                    break
+        
+        # If still no username found, try simpler patterns
+        if not username or username == "Unknown User":
+            for row_value in candidates:
+                username_part = row_value.split('_', 2)[1]
+                if len(username_part) > 1:
+                    # Take the second part and remove numbers
+                    username = ''.join(ALPHA_PATTERN.findall(username_part))
+                    if username and len(username) > 1:
+                        break
         
         # Use positional column logic
         run_column = columns[0]  # First column is always run column
@@ -164,12 +236,11 @@ class BranchViewAnalyzer:
         
         # Create meaningful stage names from the first row (original header)
         stage_names = []
-        if all_data and len(all_data) > 0:
-            first_row = all_data[0]
+        if first_row is not None:
             for col in stage_columns:
                 stage_value = str(first_row.get(col, col))
                 # Clean up stage name (remove numbers, keep base name)
-                clean_name = ''.join([c for c in stage_value if c.isalpha()])
+                clean_name = ''.join(ALPHA_PATTERN.findall(stage_value))
                 if clean_name:
                     stage_names.append(clean_name)
                 else:
@@ -195,8 +266,13 @@ class BranchViewAnalyzer:
             'column_order': {stage: idx for idx, stage in enumerate(stage_columns)}
         }
     
-    def _detect_copy_patterns(self, sheets_data: Dict[str, Any], data_analysis: Dict[str, Any]) -> Dict[str, Any]:
-        """Detect patterns where data is copied from previous runs"""
+    def _detect_copy_patterns(self, sheets_data: Dict[str, Any], data_analysis: Dict[str, Any],
+                              row_chunks: Optional[Iterable[Any]] = None) -> Dict[str, Any]:
+        """Detect patterns where data is copied from previous runs
+        
+        row_chunks optionally supplies the rows as an iterable of DataFrame chunks
+        (large CSVs) instead of the first sheet in sheets_data.
+        """
         
         first_sheet_data = list(sheets_data.values())[0]
         run_column = data_analysis['run_column']
@@ -209,116 +285,108 @@ class BranchViewAnalyzer:
         runs_data = {}
         
         if HAS_PANDAS and hasattr(first_sheet_data, 'iterrows'):
-            # Pandas DataFrame
-            for _, row in first_sheet_data.iterrows():
-                run_name = str(row[run_column])
-                if run_name not in runs_data:
-                    runs_data[run_name] = {}
-                
-                for stage in stage_columns:
-                    runs_data[run_name][stage] = str(row[stage]) if pd.notna(row[stage]) else ''
+            # Pandas DataFrame, or a stream of chunks: plain tuples avoid a Series per row
+            columns_order = [run_column] + list(stage_columns)
+            frames = row_chunks if row_chunks is not None else [first_sheet_data]
+            rows = (
+                row
+                for frame in frames
+                for row in frame[columns_order].fillna('').itertuples(index=False, name=None)
+            )
         else:
             # Fallback dict format
-            for row in first_sheet_data:
-                run_name = str(row[run_column])
-                if run_name not in runs_data:
-                    runs_data[run_name] = {}
-                
-                for stage in stage_columns:
-                    runs_data[run_name][stage] = str(row.get(stage, '')) if row.get(stage) else ''
+            rows = (
+                (row[run_column],) + tuple(row.get(stage) for stage in stage_columns)
+                for row in first_sheet_data
+            )
+        
+        # runs_data only grows with unique runs
+        for row in rows:
+            run_name = str(row[0])
+            if run_name not in runs_data:
+                runs_data[run_name] = {}
+            
+            run_values = runs_data[run_name]
+            for stage, value in zip(stage_columns, row[1:]):
+                run_values[stage] = normalize_cell(value)
         
         # Sort runs by extracting numbers, but treat header row as Run 0 (first)
-        def extract_run_number(run_name):
-            # If it's the header row (no numbers), treat as Run 0
-            numbers = re.findall(r'\d+', run_name)
-            if not numbers:
-                return 0  # Header row comes first
-            return int(numbers[0])
-        
-        sorted_runs = sorted(runs_data.keys(), key=extract_run_number)
+        sorted_runs = sorted(runs_data, key=extract_run_number)
         
         logger.info(f"Analyzing copy patterns for runs: {sorted_runs}")
         
+        # First occurrence of every non-empty value in earlier runs:
+        # value -> (run_name, stage, stage_idx), in run/stage order.
+        # Runs are indexed after they are analyzed, so a lookup only ever sees previous runs.
+        value_first_seen: Dict[str, Tuple[str, str, int]] = {}
+        
         # Analyze each run for copied data
         for i, current_run in enumerate(sorted_runs):
-            if i == 0:  # First run (header row) has no previous runs to copy from
-                continue
-            
             current_data = runs_data[current_run]
-            copy_patterns[current_run] = {
-                'copied_from': {},
-                'branch_point': None,
-                'skipped_stages': [],
-                'new_stages': []
-            }
             
-            # Check each stage in current run
-            for stage_idx, stage in enumerate(stage_columns):
-                current_value = current_data.get(stage, '')
-                
-                if not current_value:
-                    continue
+            if i > 0:  # First run (header row) has no previous runs to copy from
+                copied_from = {}
+                new_stages = []
+                run_pattern = copy_patterns[current_run] = {
+                    'copied_from': copied_from,
+                    'branch_point': None,
+                    'skipped_stages': [],
+                    'new_stages': new_stages
+                }
                 
-                # Look for this value in previous runs
-                found_copy = False
-                for prev_run in sorted_runs[:i]:
-                    prev_data = runs_data[prev_run]
+                # Check each stage in current run
+                for stage_idx, stage in enumerate(stage_columns):
+                    current_value = current_data.get(stage, '')
+                    
+                    if not current_value:
+                        continue
                     
-                    # Check if current stage value matches any stage in previous run
-                    for prev_stage_idx, prev_stage in enumerate(stage_columns):
-                        prev_value = prev_data.get(prev_stage, '')
+                    # Earliest previous (run, stage) holding this exact value (indicating data copying)
+                    first_seen = value_first_seen.get(current_value)
+                    if first_seen:
+                        prev_run, prev_stage, prev_stage_idx = first_seen
+                        copied_from[stage] = {
+                            'source_run': prev_run,
+                            'source_stage': prev_stage,
+                            'source_stage_index': prev_stage_idx,
+                            'current_stage_index': stage_idx,
+                            'value': current_value
+                        }
                         
-                        # Check for exact match (indicating data copying)
-                        if prev_value and current_value == prev_value:
-                            # Found a copy!
-                            copy_patterns[current_run]['copied_from'][stage] = {
-                                'source_run': prev_run,
-                                'source_stage': prev_stage,
-                                'source_stage_index': prev_stage_idx,
-                                'current_stage_index': stage_idx,
-                                'value': current_value
+                        # Determine branch point (where copying starts)
+                        if run_pattern['branch_point'] is None:
+                            run_pattern['branch_point'] = {
+                                'stage': prev_stage,
+                                'stage_index': prev_stage_idx,
+                                'source_run': prev_run
                             }
-                            
-                            # Determine branch point (where copying starts)
-                            if copy_patterns[current_run]['branch_point'] is None:
-                                copy_patterns[current_run]['branch_point'] = {
-                                    'stage': prev_stage,
-                                    'stage_index': prev_stage_idx,
-                                    'source_run': prev_run
-                                }
-                            
-                            found_copy = True
-                            break
-                    
-                    if found_copy:
-                        break
-                
-                # If no copy found, this is a new stage
-                if not found_copy:
-                    copy_patterns[current_run]['new_stages'].append({
-                        'stage': stage,
-                        'stage_index': stage_idx,
-                        'value': current_value
-                    })
-            
-            # Determine skipped stages
-            if copy_patterns[current_run]['branch_point']:
-                branch_point_idx = copy_patterns[current_run]['branch_point']['stage_index']
-                
-                # Find first new stage
-                first_new_stage_idx = None
-                for new_stage in copy_patterns[current_run]['new_stages']:
-                    if first_new_stage_idx is None or new_stage['stage_index'] < first_new_stage_idx:
-                        first_new_stage_idx = new_stage['stage_index']
+                    else:
+                        # If no copy found, this is a new stage
+                        new_stages.append({
+                            'stage': stage,
+                            'stage_index': stage_idx,
+                            'value': current_value
+                        })
                 
-                if first_new_stage_idx is not None:
+                # Determine skipped stages
+                if run_pattern['branch_point'] and new_stages:
+                    branch_point_idx = run_pattern['branch_point']['stage_index']
+                    
+                    # New stages are collected in stage order, so the first one has the lowest index
+                    first_new_stage_idx = new_stages[0]['stage_index']
+                    
                     # Stages between branch point and first new stage are skipped
-                    for skip_idx in range(branch_point_idx + 1, first_new_stage_idx):
-                        if skip_idx < len(stage_columns):
-                            copy_patterns[current_run]['skipped_stages'].append({
-                                'stage': stage_columns[skip_idx],
-                                'stage_index': skip_idx
-                            })
+                    for skip_idx in range(branch_point_idx + 1, min(first_new_stage_idx, len(stage_columns))):
+                        run_pattern['skipped_stages'].append({
+                            'stage': stage_columns[skip_idx],
+                            'stage_index': skip_idx
+                        })
+            
+            # Make this run's values visible to the runs after it
+            for stage_idx, stage in enumerate(stage_columns):
+                value = current_data.get(stage, '')
+                if value:
+                    value_first_seen.setdefault(value, (current_run, stage, stage_idx))
         
         return {
             'runs_data': runs_data,
@@ -343,22 +411,6 @@ class BranchViewAnalyzer:
         spacing_x = 220
         spacing_y = 120
         
-        # Stage colors
-        stage_colors = {
-            'floorplan': '#3498DB', 'floor': '#3498DB', 'fp': '#3498DB',
-            'place': '#2ECC71', 'placement': '#2ECC71', 'pl': '#2ECC71',
-            'cts': '#F39C12', 'clock': '#F39C12', 'ct': '#F39C12',
-            'route': '#E74C3C', 'routing': '#E74C3C', 'rt': '#E74C3C',
-            'drc': '#9B59B6', 'check': '#9B59B6', 'verify': '#9B59B6'
-        }
-        
-        def get_stage_color(stage_name):
-            stage_lower = stage_name.lower()
-            for pattern, color in stage_colors.items():
-                if pattern in stage_lower:
-                    return color
-            return '#34495E'  # Default color
-        
         layout_data = {
             "nodes": [],
             "connections": [],
@@ -386,69 +438,83 @@ class BranchViewAnalyzer:
             }
         }
         
+        # Nodes and connections with identical styles share a single dict instead of
+        # each carrying its own copy; the serialized layout is unchanged
+        style_registry = {}
+        
+        def shared_style(style):
+            return style_registry.setdefault(tuple(style.items()), style)
+        
         # Track all nodes for connection logic
-        all_nodes = {}
+        all_node_ids = set()
         run_flows = {}  # Track the flow of each run
         
         # STEP 1: Create nodes for all runs
+        stage_mapping = data_analysis.get('stage_mapping') or {}
+        nodes = layout_data["nodes"]
+        
         for run_idx, run_name in enumerate(sorted_runs):
             run_data = runs_data[run_name]
             base_y = 100 + (run_idx * spacing_y)
             
+            # Per-run copy information, looked up once instead of per node
+            run_copy_info = copy_pattern_data.get(run_name, {})
+            copied_stages = run_copy_info.get('copied_from') or {}
+            is_branch_run = len(copied_stages) > 0
+            branch_stroke = "#FFD700" if is_branch_run else "white"
+            branch_stroke_width = 3 if is_branch_run else 2
+            
+            run_nodes = []
             run_flows[run_name] = {
-                'nodes': [],
-                'is_branch': run_name in copy_pattern_data and len(copy_pattern_data[run_name].get('copied_from', {})) > 0,
-                'branch_info': copy_pattern_data.get(run_name, {}),
+                'nodes': run_nodes,
+                'is_branch': is_branch_run,
+                'branch_info': run_copy_info,
                 'y_position': base_y
             }
             
             # Create nodes for stages that have data
             for stage_idx, stage in enumerate(stage_columns):
-                stage_value = run_data.get(stage, '').strip()
+                stage_value = run_data.get(stage, '')  # already stripped in _detect_copy_patterns
                 if not stage_value:
                     continue
                 
+                # SKIP creating nodes for copied stages - they should not be displayed
+                if stage in copied_stages:
+                    continue
+                
                 node_id = f"{run_name}_{stage}"
                 x_pos = 100 + (stage_idx * spacing_x)
                 
-                # Check if this stage is copied from another run
-                is_copied = False
-                if run_name in copy_pattern_data:
-                    copied_stages = copy_pattern_data[run_name].get('copied_from', {})
-                    is_copied = stage in copied_stages
+                # Get proper stage name from mapping
+                stage_display_name = stage_mapping.get(stage, stage)
                 
-                # SKIP creating nodes for copied stages - they should not be displayed
-                if not is_copied:
-                    # Get proper stage name from mapping
-                    stage_display_name = data_analysis.get('stage_mapping', {}).get(stage, stage)
-                    
-                    node = {
-                        "id": node_id,
-                        "label": f"{stage_value}",
-                        "x": x_pos,
-                        "y": base_y,
-                        "type": "stage",
-                        "run": run_name,
-                        "stage": stage,
-                        "stage_name": stage_display_name,
-                        "stage_index": stage_idx,
-                        "value": stage_value,
-                        "is_branch": run_name in copy_pattern_data and len(copy_pattern_data[run_name].get('copied_from', {})) > 0,
-                        "style": {
-                            "width": node_width,
-                            "height": node_height,
-                            "fill": get_stage_color(stage_display_name),
-                            "stroke": "#FFD700" if (run_name in copy_pattern_data and len(copy_pattern_data[run_name].get('copied_from', {})) > 0) else "white",
-                            "strokeWidth": 3 if (run_name in copy_pattern_data and len(copy_pattern_data[run_name].get('copied_from', {})) > 0) else 2,
-                            "cornerRadius": 8,
-                            "fontSize": 12,
-                            "textColor": "white",
-                            "fontWeight": "bold"
-                        }
-                    }
-                    layout_data["nodes"].append(node)
-                    all_nodes[node_id] = node
-                    run_flows[run_name]['nodes'].append(node)
+                node = {
+                    "id": node_id,
+                    "label": f"{stage_value}",
+                    "x": x_pos,
+                    "y": base_y,
+                    "type": "stage",
+                    "run": run_name,
+                    "stage": stage,
+                    "stage_name": stage_display_name,
+                    "stage_index": stage_idx,
+                    "value": stage_value,
+                    "is_branch": is_branch_run,
+                    "style": shared_style({
+                        "width": node_width,
+                        "height": node_height,
+                        "fill": get_stage_color(stage_display_name.lower()),
+                        "stroke": branch_stroke,
+                        "strokeWidth": branch_stroke_width,
+                        "cornerRadius": 8,
+                        "fontSize": 12,
+                        "textColor": "white",
+                        "fontWeight": "bold"
+                    })
+                }
+                nodes.append(node)
+                all_node_ids.add(node_id)
+                run_nodes.append(node)
         
         # STEP 2: Generate connections with proper branching logic
         for run_idx, run_name in enumerate(sorted_runs):
@@ -464,11 +530,11 @@ class BranchViewAnalyzer:
                             "to": node["id"],
                             "type": "straight",
                             "connection_category": "linear",
-                            "style": {
+                            "style": shared_style({
                                 "stroke": "white",
                                 "strokeWidth": 3,
                                 "arrowSize": 10
-                            }
+                            })
                         })
                     prev_node = node
             else:
@@ -478,46 +544,39 @@ class BranchViewAnalyzer:
                 
                 if copied_stages:
                     # Find the LAST copied stage (highest stage index) - this is the branch point
-                    last_copied_stage = None
-                    last_copied_stage_idx = -1
-                    last_copy_info = None
+                    last_copied_stage, last_copy_info = max(
+                        copied_stages.items(), key=lambda item: item[1]['current_stage_index']
+                    )
+                    last_copied_stage_idx = last_copy_info['current_stage_index']
                     
-                    for copied_stage, copy_info in copied_stages.items():
-                        stage_idx = copy_info['current_stage_index']
-                        if stage_idx > last_copied_stage_idx:
-                            last_copied_stage_idx = stage_idx
-                            last_copied_stage = copied_stage
-                            last_copy_info = copy_info
+                    # Branch from the LAST copied stage to the FIRST new stage
+                    source_run = last_copy_info['source_run']
+                    source_stage = last_copy_info['source_stage']
+                    source_node_id = f"{source_run}_{source_stage}"
                     
-                    if last_copy_info:
-                        # Branch from the LAST copied stage to the FIRST new stage
-                        source_run = last_copy_info['source_run']
-                        source_stage = last_copy_info['source_stage']
-                        source_node_id = f"{source_run}_{source_stage}"
-                        
-                        # Find the first new stage in current run (after the last copied stage)
-                        first_new_node = None
-                        for node in sorted(run_flow['nodes'], key=lambda x: x['stage_index']):
-                            if node['stage_index'] > last_copied_stage_idx:
-                                first_new_node = node
-                                break
-                        
-                        # Create branch connection from LAST copied stage to FIRST new stage
-                        if source_node_id in all_nodes and first_new_node:
-                            layout_data["connections"].append({
-                                "from": source_node_id,
-                                "to": first_new_node["id"],
-                                "type": "curved",
-                                "connection_category": "branch",
-                                "style": {
-                                    "stroke": "#FFD700",
-                                    "strokeWidth": 4,
-                                    "arrowSize": 12,
-                                    "strokeDasharray": "8,4"
-                                }
+                    # Find the first new stage in current run (after the last copied stage);
+                    # run nodes are created in stage order, so they are already sorted
+                    run_nodes = run_flow['nodes']
+                    stage_indices = [node['stage_index'] for node in run_nodes]
+                    first_new_pos = bisect.bisect_right(stage_indices, last_copied_stage_idx)
+                    first_new_node = run_nodes[first_new_pos] if first_new_pos < len(run_nodes) else None
+                    
+                    # Create branch connection from LAST copied stage to FIRST new stage
+                    if source_node_id in all_node_ids and first_new_node:
+                        layout_data["connections"].append({
+                            "from": source_node_id,
+                            "to": first_new_node["id"],
+                            "type": "curved",
+                            "connection_category": "branch",
+                            "style": shared_style({
+                                "stroke": "#FFD700",
+                                "strokeWidth": 4,
+                                "arrowSize": 12,
+                                "strokeDasharray": "8,4"
                             })
-                            
-                            logger.info(f"Created branch connection: {source_node_id} -> {first_new_node['id']} (from LAST copied stage {last_copied_stage})")
+                        })
+                        
+                        logger.info(f"Created branch connection: {source_node_id} -> {first_new_node['id']} (from LAST copied stage {last_copied_stage})")
                 
                 # Connect consecutive new stages within the branch (only the visible nodes)
                 visible_nodes = [node for node in run_flow['nodes']]  # All nodes in run_flow are already non-copied
@@ -531,11 +590,11 @@ class BranchViewAnalyzer:
                             "to": node["id"],
                             "type": "straight",
                             "connection_category": "branch_linear",
-                            "style": {
+                            "style": shared_style({
                                 "stroke": "#FFD700",
                                 "strokeWidth": 3,
                                 "arrowSize": 10
-                            }
+                            })
                         })
                     prev_node = node
         
@@ -551,8 +610,38 @@ class BranchViewAnalyzer:
         
         return layout_data
 
-def analyze_branch_view(file_path: str) -> Dict[str, Any]:
-    """Main function to analyze and generate branch view"""
+def dumps_json(obj: Any) -> str:
+    """Serialize to a compact JSON string
+    
+    ASCII escaping is kept because the Node callers decode stdout per chunk, which
+    would split multibyte characters that straddle a pipe chunk.
+    """
+    return json.dumps(obj, separators=(',', ':'))
+
+def write_layout_json(layout: Dict[str, Any], out: TextIO, stream_keys: Tuple[str, ...] = ('nodes', 'connections')) -> None:
+    """Write a layout as JSON, encoding the large node/connection lists one item at a time
+    
+    Avoids holding the complete JSON text for big layouts in memory next to the dict itself.
+    """
+    out.write('{')
+    for key_idx, (key, value) in enumerate(layout.items()):
+        if key_idx:
+            out.write(',')
+        out.write(dumps_json(key))
+        out.write(':')
+        if key in stream_keys and isinstance(value, list):
+            out.write('[')
+            for item_idx, item in enumerate(value):
+                if item_idx:
+                    out.write(',')
+                out.write(dumps_json(item))
+            out.write(']')
+        else:
+            out.write(dumps_json(value))
+    out.write('}\n')
+
+def analyze_branch_view(file_path: Union[str, BinaryIO]) -> Dict[str, Any]:
+    """Main function to analyze and generate branch view (path or binary file-like)"""
     try:
         # Use the simple, clean analyzer with user's exact logic
         from simple_branch_analyzer import analyze_branch_view as simple_analyze
@@ -565,14 +654,15 @@ if __name__ == "__main__":
     import sys
     
     if len(sys.argv) != 2:
-        print(json.dumps({"error": "Usage: python branch_analyzer.py <file_path>"}))
+        print(dumps_json({"error": "Usage: python branch_analyzer.py <file_path>"}))
         sys.exit(1)
     
     file_path = sys.argv[1]
     
     try:
         result = analyze_branch_view(file_path)
-        print(json.dumps(result))
     except Exception as e:
-        print(json.dumps({"error": str(e)}))
-        sys.exit(1)
\ No newline at end of file
+        print(dumps_json({"error": str(e)}))
+        sys.exit(1)
+    
+    write_layout_json(result, sys.stdout)
@@ -4,11 +4,43 @@ This module uses LLM to analyze header columns and data patterns to generate tre
 """
 
 import pandas as pd
+import numpy as np
 import json
 import logging
+import os
 import re
-from typing import Dict, List, Any, Optional, Tuple
+import time
+import copy
+import math
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, OrderedDict
+from difflib import get_close_matches
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+import atexit
+import bisect
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import pyarrow as pa
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Optional persistent backend for the LLM response cache
+try:
+    import diskcache
+    HAS_DISKCACHE = True
+except ImportError:
+    HAS_DISKCACHE = False
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +49,200 @@ logger = logging.getLogger(__name__)
 OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL = "mistral"
 
+# A few rows plus dtypes are enough to disambiguate columns; fewer prompt tokens means faster prefill
+PROMPT_SAMPLE_ROWS = 3
+
+# Keep the model loaded between uploads, decode deterministically and cap the response length
+OLLAMA_KEEP_ALIVE = "10m"
+OLLAMA_OPTIONS = {"num_predict": 1024, "temperature": 0}
+
+# Ollama serves at most OLLAMA_NUM_PARALLEL requests per model at once; extra workers only queue
+MAX_PARALLEL_REQUESTS = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+
+# One pooled keep-alive session for every model call instead of a new connection per request
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_SESSION.headers.update({"Connection": "keep-alive"})
+atexit.register(_SESSION.close)
+
+# Patterns used in per-column and per-run loops, compiled once
+RUN_PREFIX_PATTERN = re.compile(r'^r\d+', re.IGNORECASE)
+DIGITS_PATTERN = re.compile(r'\d+')
+JSON_COMMENT_PATTERN = re.compile(r'//.*?\n|/\*.*?\*/', re.DOTALL)
+
+# Header names that identify each role on their own, without needing sample rows
+ROLE_HEADER_PATTERNS = (
+    re.compile(r'user|owner|person|entity'),
+    re.compile(r'run|iteration'),
+    re.compile(r'stage|step|phase')
+)
+
+# Identical schemas produce identical prompts, so model responses are reused for a week
+# (every RUN_STATUS cache lives under ~/.cache/runstatus)
+LLM_CACHE_DIR = os.path.expanduser("~/.cache/runstatus/llm")
+LLM_CACHE_TTL = 7 * 86400
+LLM_CACHE_SIZE = 256
+
+class LLMCache:
+    """In-process LRU of model responses, backed by diskcache when it is installed"""
+    
+    def __init__(self, maxsize: int = LLM_CACHE_SIZE, ttl: int = LLM_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.memory = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+        self.disk = None
+        if HAS_DISKCACHE:
+            try:
+                self.disk = diskcache.Cache(LLM_CACHE_DIR)
+            except Exception as e:
+                logger.warning(f"LLM disk cache unavailable: {e}")
+    
+    @staticmethod
+    def cache_key(headers: List[str], sample_data: List[Dict[str, Any]]) -> str:
+        """Hash the headers and sample rows that make up the prompt"""
+        payload = json.dumps({"h": headers, "s": sample_data}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and time.time() - entry[1] < self.ttl:
+                self.memory.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[0]
+        if self.disk is not None:
+            response = self.disk.get(key)
+            if response is not None:
+                self._remember(key, response)
+                self.stats["hits"] += 1
+                return response
+        self.stats["misses"] += 1
+        return None
+    
+    def set(self, key: str, response: str) -> None:
+        self._remember(key, response)
+        if self.disk is not None:
+            self.disk.set(key, response, expire=self.ttl)
+    
+    def _remember(self, key: str, response: str) -> None:
+        with self.lock:
+            self.memory[key] = (response, time.time())
+            self.memory.move_to_end(key)
+            if len(self.memory) > self.maxsize:
+                self.memory.popitem(last=False)
+
+# Shared across analyzer instances so repeat uploads of the same schema skip the model
+_LLM_CACHE = LLMCache()
+
+# Second tier: reuse an earlier analysis when only column order or sample rows differ
+SCHEMA_SIMILARITY_THRESHOLD = 0.95
+SCHEMA_INDEX_SIZE = 128
+
+def _schema_fingerprint(df: pd.DataFrame) -> Counter:
+    """Bag of lowercased column name + dtype tokens, independent of column order"""
+    return Counter(f"{str(col).strip().lower()}:{df[col].dtype}" for col in df.columns)
+
+def _cosine(a: Counter, b: Counter) -> float:
+    dot = sum(count * b[token] for token, count in a.items() if token in b)
+    if not dot:
+        return 0.0
+    norm_a = math.sqrt(sum(v * v for v in a.values()))
+    norm_b = math.sqrt(sum(v * v for v in b.values()))
+    return dot / (norm_a * norm_b)
+
+class SchemaIndex:
+    """Small similarity index of schema fingerprints to previously parsed analyses"""
+    
+    def __init__(self, maxsize: int = SCHEMA_INDEX_SIZE, threshold: float = SCHEMA_SIMILARITY_THRESHOLD):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.entries = []
+    
+    def lookup(self, fingerprint: Counter) -> Optional[Dict[str, Any]]:
+        best_sim, best = 0.0, None
+        for vec, analysis in self.entries:
+            sim = _cosine(fingerprint, vec)
+            if sim > best_sim:
+                best_sim, best = sim, analysis
+        if best is not None and best_sim > self.threshold:
+            logger.info(f"Reusing analysis of a similar schema (similarity {best_sim:.3f})")
+            return copy.deepcopy(best)
+        return None
+    
+    def add(self, fingerprint: Counter, analysis: Dict[str, Any]) -> None:
+        self.entries.append((fingerprint, copy.deepcopy(analysis)))
+        if len(self.entries) > self.maxsize:
+            del self.entries[0]
+
+_SCHEMA_INDEX = SchemaIndex()
+
+# Set RUNSTATUS_FORCE_LLM=1 to always consult the model, even for self-describing data
+FORCE_LLM = os.environ.get("RUNSTATUS_FORCE_LLM", "0") == "1"
+
+# Stage palette, cycled by stage index
+STAGE_COLORS = (
+    "#4A90E2",  # Blue
+    "#50C878",  # Emerald Green  
+    "#FFD700",  # Gold
+    "#FF6B6B",  # Coral Red
+    "#9B59B6",  # Purple
+    "#FF8C00",  # Dark Orange
+    "#20B2AA",  # Light Sea Green
+    "#DC143C",  # Crimson
+    "#4169E1",  # Royal Blue
+    "#32CD32"   # Lime Green
+)
+
+# Node and connection styles are shared between layout entries; consumers must not mutate them
+NODE_STYLE_BASE = {
+    "stroke": "white",
+    "strokeWidth": 2,
+    "cornerRadius": 5,
+    "fontSize": 12,
+    "textColor": "white"
+}
+CONNECTION_STYLE = {
+    "stroke": "white",
+    "strokeWidth": 2,
+    "arrowSize": 8
+}
+
+def _node_style(fill: str) -> Dict[str, Any]:
+    """Stage node style with the given fill on top of the shared base"""
+    return {"width": 140, "height": 50, "fill": fill, **NODE_STYLE_BASE}
+
+def dumps_json(obj: Any) -> str:
+    """Compact JSON for prompts and layouts, using orjson when it is installed"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=str)
+
+def _sample_records(df: pd.DataFrame, n: int) -> List[Dict[str, Any]]:
+    """First n rows as plain dicts, converted column-wise through Arrow when available"""
+    sample = df.head(n)
+    if HAS_PYARROW:
+        try:
+            return pa.Table.from_pandas(sample, preserve_index=False).to_pylist()
+        except (pa.ArrowException, ValueError, TypeError):
+            # Mixed-type object columns have no Arrow type; use pandas instead
+            pass
+    return sample.to_dict('records')
+
+def _needs_samples(headers: List[Any]) -> bool:
+    """Sample rows are only worth their prompt tokens when some role is not named in the headers"""
+    lower_headers = [str(header).lower() for header in headers]
+    return not all(
+        any(pattern.search(header) for header in lower_headers)
+        for pattern in ROLE_HEADER_PATTERNS
+    )
+
+def _run_sort_key(run: str) -> int:
+    """Numeric part of a run label (first digit group), or 0 when there is none"""
+    match = DIGITS_PATTERN.search(run)
+    return int(match.group()) if match else 0
+
 class DataStructureAnalyzer:
     """Analyzes data structure using LLM to identify patterns and relationships"""
     
@@ -25,12 +251,61 @@ class DataStructureAnalyzer:
         self.stage_order = []
         self.stage_colors = {}
         self.data_patterns = {}
+        self.cache = _LLM_CACHE
+        self.fingerprint_index = _SCHEMA_INDEX
+    
+    def _can_resolve_without_llm(self, df: pd.DataFrame) -> bool:
+        """True when the fallback heuristics can identify every column unambiguously"""
+        lower_cols = [str(col).lower() for col in df.columns]
+        user_patterns = ['user', 'name', 'person', 'entity', 'id']
+        
+        # Exactly one candidate per role, judged the way _fallback_analysis picks its columns
+        user_idx = [i for i, col in enumerate(lower_cols) if any(p in col for p in user_patterns)]
+        run_idx = [
+            i for i, col in enumerate(lower_cols)
+            if 'run' in col or df.iloc[:20, i].astype(str).str.match(RUN_PREFIX_PATTERN).any()
+        ]
+        if len(user_idx) != 1 or len(run_idx) != 1 or user_idx == run_idx:
+            return False
+        
+        other_idx = [i for i in range(len(lower_cols)) if i not in (user_idx[0], run_idx[0])]
+        stage_idx = [i for i in other_idx if any(p in lower_cols[i] for p in ('stage', 'step', 'phase'))]
+        return len(stage_idx or other_idx) == 1
     
     def analyze_headers(self, df: pd.DataFrame) -> Dict[str, Any]:
         """Analyze header columns to identify data structure patterns"""
         try:
+            if not FORCE_LLM and self._can_resolve_without_llm(df):
+                logger.info("Column roles are unambiguous, skipping model analysis")
+                return self._fallback_analysis(df)
+            
             headers = list(df.columns)
-            sample_data = df.head(10).to_dict('records')
+            sample_data = _sample_records(df, PROMPT_SAMPLE_ROWS)
+            schema = {str(col): str(dtype) for col, dtype in df.dtypes.items()}
+            cache_key = self.cache.cache_key(headers, sample_data)
+            
+            # Without sample rows the model cannot see the stage values, so its stage list is replaced from the data
+            needs_samples = _needs_samples(headers)
+            
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"LLM cache hit (cache_stats: {self.cache.stats})")
+                try:
+                    return self._validate_analysis(self._clean_json_response(cached), df,
+                                                   rebuild_stages=not needs_samples)
+                except Exception as e:
+                    logger.warning(f"Failed to parse cached LLM response: {e}")
+            
+            fingerprint = _schema_fingerprint(df)
+            similar = self.fingerprint_index.lookup(fingerprint)
+            if similar is not None:
+                # The fingerprint only covers column names and types, so only the column roles carry over
+                return self._validate_analysis(similar, df, rebuild_stages=True)
+            
+            # Self-describing headers make the sample rows redundant; stages are rebuilt on validation
+            sample_block = ""
+            if needs_samples:
+                sample_block = f"Sample Data (first {len(sample_data)} rows):\n            {dumps_json(sample_data)}"
             
             # Create prompt for LLM to analyze the data structure
             prompt = f"""
@@ -38,8 +313,9 @@ class DataStructureAnalyzer:
             
             Headers: {headers}
             
-            Sample Data (first 10 rows):
-            {json.dumps(sample_data, indent=2)}
+            Column types: {dumps_json(schema)}
+            
+            {sample_block}
             
             Based on this data, identify:
             1. Which column represents the user/entity identifier
@@ -83,7 +359,9 @@ class DataStructureAnalyzer:
             
             try:
                 analysis = self._clean_json_response(response)
-                return self._validate_analysis(analysis, df)
+                self.cache.set(cache_key, response)
+                self.fingerprint_index.add(fingerprint, analysis)
+                return self._validate_analysis(analysis, df, rebuild_stages=not needs_samples)
             except Exception as e:
                 logger.warning(f"Failed to parse LLM response: {e}")
                 return self._fallback_analysis(df)
@@ -96,10 +374,12 @@ class DataStructureAnalyzer:
         """Get response from Ollama model"""
         try:
             logger.info("Sending request to Ollama model for data analysis...")
-            response = requests.post(OLLAMA_URL, json={
+            response = _SESSION.post(OLLAMA_URL, json={
                 "model": MODEL,
                 "prompt": prompt,
-                "stream": False
+                "stream": False,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+                "options": OLLAMA_OPTIONS
             }, timeout=60)
             
             response.raise_for_status()
@@ -116,8 +396,8 @@ class DataStructureAnalyzer:
     def _clean_json_response(self, response: str) -> Dict[str, Any]:
         """Clean and extract JSON from model response"""
         try:
-            # First try direct JSON parsing
-            return json.loads(response)
+            # First try direct JSON parsing (orjson errors subclass json.JSONDecodeError)
+            return orjson.loads(response) if HAS_ORJSON else json.loads(response)
         except json.JSONDecodeError:
             # Clean up the response
             cleaned = response
@@ -129,7 +409,7 @@ class DataStructureAnalyzer:
                 cleaned = cleaned.split("```")[0]
                 
             # Remove any comments (both // and /* */ style)
-            cleaned = re.sub(r'//.*?\n|/\*.*?\*/', '', cleaned, flags=re.DOTALL)
+            cleaned = JSON_COMMENT_PATTERN.sub('', cleaned)
             
             # Remove any leading/trailing whitespace and newlines
             cleaned = cleaned.strip()
@@ -148,10 +428,15 @@ class DataStructureAnalyzer:
                     pass
                 raise ValueError("Could not extract valid JSON from response")
     
-    def _validate_analysis(self, analysis: Dict[str, Any], df: pd.DataFrame) -> Dict[str, Any]:
-        """Validate the analysis results against actual data"""
+    def _validate_analysis(self, analysis: Dict[str, Any], df: pd.DataFrame,
+                           rebuild_stages: bool = False) -> Dict[str, Any]:
+        """Validate the analysis results against actual data; rebuild_stages replaces the stage list with the data's own"""
         try:
-            # Check if identified columns exist
+            # Check if identified columns exist, repairing near-miss names before giving up
+            for role in ("user_column", "run_column", "stage_column"):
+                repaired = self._match_column(analysis.get(role), df)
+                if repaired is not None:
+                    analysis[role] = repaired
             user_col = analysis.get("user_column")
             run_col = analysis.get("run_column") 
             stage_col = analysis.get("stage_column")
@@ -160,6 +445,10 @@ class DataStructureAnalyzer:
                 logger.warning("LLM identified columns not found in data, using fallback")
                 return self._fallback_analysis(df)
             
+            if rebuild_stages:
+                analysis["stages"] = self._data_stages(df, stage_col)
+                return analysis
+            
             # Validate stages exist in data
             identified_stages = [s["name"] for s in analysis.get("stages", [])]
             actual_stages = set(df[stage_col].unique())
@@ -182,6 +471,19 @@ class DataStructureAnalyzer:
             logger.error(f"Error validating analysis: {e}")
             return self._fallback_analysis(df)
     
+    def _match_column(self, name: Any, df: pd.DataFrame) -> Optional[Any]:
+        """Map a model-reported column name onto an actual column: exact, case-insensitive, then fuzzy"""
+        if not isinstance(name, str):
+            return None
+        if name in df.columns:
+            return name
+        by_lower = {str(col).strip().lower(): col for col in df.columns}
+        key = name.strip().lower()
+        if key in by_lower:
+            return by_lower[key]
+        close = get_close_matches(key, list(by_lower), n=1, cutoff=0.7)
+        return by_lower[close[0]] if close else None
+    
     def _fallback_analysis(self, df: pd.DataFrame) -> Dict[str, Any]:
         """Fallback analysis when LLM fails"""
         logger.info("Using fallback analysis...")
@@ -192,30 +494,23 @@ class DataStructureAnalyzer:
         run_col = None
         stage_col = None
         
+        lower_cols = df.columns.astype(str).str.lower()
+        
         # Look for user column (common names)
-        user_patterns = ['user', 'name', 'person', 'entity', 'id']
-        for col in columns:
-            if any(pattern in col.lower() for pattern in user_patterns):
-                user_col = col
-                break
+        user_mask = lower_cols.str.contains('user|name|person|entity|id', regex=True)
+        if user_mask.any():
+            user_col = columns[user_mask.argmax()]
         
-        # Look for run column (contains 'run' or has r1, r2 pattern)
-        for col in columns:
-            if 'run' in col.lower():
-                run_col = col
-                break
-            # Check if column values match run pattern
-            sample_values = df[col].astype(str).str.lower().unique()[:5]
-            if any(re.match(r'^r\d+', val) for val in sample_values):
-                run_col = col
-                break
+        # Look for run column (contains 'run' or has r1, r2 pattern), sampling every column in one pass
+        run_values = df.head(20).astype(str).apply(lambda s: s.str.match(RUN_PREFIX_PATTERN).any())
+        run_mask = lower_cols.str.contains('run', regex=False) | run_values.to_numpy(dtype=bool)
+        if run_mask.any():
+            run_col = columns[run_mask.argmax()]
         
         # Look for stage column (remaining column or contains 'stage')
-        for col in columns:
-            if col not in [user_col, run_col]:
-                if 'stage' in col.lower() or 'step' in col.lower() or 'phase' in col.lower():
-                    stage_col = col
-                    break
+        stage_mask = lower_cols.str.contains('stage|step|phase', regex=True) & ~df.columns.isin([user_col, run_col])
+        if stage_mask.any():
+            stage_col = columns[stage_mask.argmax()]
         
         # If still not found, use remaining column
         if not stage_col:
@@ -231,15 +526,7 @@ class DataStructureAnalyzer:
                 raise ValueError("Cannot identify required columns in data")
         
         # Get unique stages and assign colors
-        unique_stages = df[stage_col].unique()
-        stages = []
-        for i, stage in enumerate(unique_stages):
-            stages.append({
-                "name": stage,
-                "order": i,
-                "color": self._generate_color(i),
-                "description": f"Stage: {stage}"
-            })
+        stages = self._data_stages(df, stage_col)
         
         return {
             "user_column": user_col,
@@ -260,216 +547,311 @@ class DataStructureAnalyzer:
             }
         }
     
+    def _data_stages(self, df: pd.DataFrame, stage_col: str) -> List[Dict[str, Any]]:
+        """Stage entries for the stage column's distinct values, in first-seen order"""
+        return [
+            {
+                "name": stage,
+                "order": i,
+                "color": STAGE_COLORS[i % len(STAGE_COLORS)],
+                "description": f"Stage: {stage}"
+            }
+            for i, stage in enumerate(df[stage_col].unique())
+        ]
+    
     def _generate_color(self, index: int) -> str:
         """Generate color for stage based on index"""
-        colors = [
-            "#4A90E2",  # Blue
-            "#50C878",  # Emerald Green  
-            "#FFD700",  # Gold
-            "#FF6B6B",  # Coral Red
-            "#9B59B6",  # Purple
-            "#FF8C00",  # Dark Orange
-            "#20B2AA",  # Light Sea Green
-            "#DC143C",  # Crimson
-            "#4169E1",  # Royal Blue
-            "#32CD32"   # Lime Green
-        ]
-        return colors[index % len(colors)]
+        return STAGE_COLORS[index % len(STAGE_COLORS)]
     
     def generate_layout_structure(self, df: pd.DataFrame, analysis: Dict[str, Any]) -> Dict[str, Any]:
         """Generate layout structure based on analysis"""
         try:
-            user_col = analysis["user_column"]
-            run_col = analysis["run_column"] 
-            stage_col = analysis["stage_column"]
-            stages_config = {s["name"]: s for s in analysis["stages"]}
+            parts = self._iter_layout_parts(df, analysis)
+            _, header = next(parts)
+            layout_data = {"nodes": [], "connections": [], **header}
+            for _, (user_nodes, user_connections) in parts:
+                layout_data["nodes"].extend(user_nodes)
+                layout_data["connections"].extend(user_connections)
+            return layout_data
             
-            # Calculate layout parameters
-            num_users = len(df[user_col].unique())
-            max_runs_per_user = df.groupby(user_col)[run_col].nunique().max()
+        except Exception as e:
+            logger.error(f"Error generating layout structure: {e}")
+            raise ValueError(f"Failed to generate layout: {str(e)}")
+    
+    def iter_layout_events(self, df: pd.DataFrame, analysis: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ("layout", header) followed by ("node", ...) and ("connection", ...) events
+        
+        Only one user's entries are held at a time, so callers can stream-serialize large layouts.
+        """
+        for kind, payload in self._iter_layout_parts(df, analysis):
+            if kind == "layout":
+                yield kind, payload
+                continue
+            user_nodes, user_connections = payload
+            for node in user_nodes:
+                yield "node", node
+            for connection in user_connections:
+                yield "connection", connection
+    
+    def _iter_layout_parts(self, df: pd.DataFrame, analysis: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+        """Yield the layout header, then each user's (nodes, connections) in display order"""
+        user_col = analysis["user_column"]
+        run_col = analysis["run_column"] 
+        stage_col = analysis["stage_column"]
+        
+        # Flat lookup tables so sort keys and styles skip the nested config dicts, built in one pass;
+        # style dicts are shared by reference across each stage's nodes
+        stages_config, order_of, color_of, style_by_stage = {}, {}, {}, {}
+        for config in analysis["stages"]:
+            name = config["name"]
+            stages_config[name] = config
+            order_of[name] = config["order"]
+            color_of[name] = config["color"]
+            style_by_stage[name] = _node_style(config["color"])
+        
+        # Calculate layout parameters
+        num_users = len(df[user_col].unique())
+        max_runs_per_user = df.groupby(user_col)[run_col].nunique().max()
+        
+        layout_width = max(2000, (len(stages_config) + 1) * 250 * 1.2)
+        layout_height = max(1500, (num_users * max_runs_per_user * 200) * 1.2)
+        
+        yield "layout", {
+            "layout": {
+                "width": layout_width,
+                "height": layout_height,
+                "background": {
+                    "color": "black",
+                    "gridSize": 50,
+                    "gridColor": "gray", 
+                    "gridOpacity": 0.3
+                },
+                "stage_colors": color_of
+            },
+            "analysis": analysis  # Include analysis for reference
+        }
+        
+        # One user with one run is a straight chain; skip the grouping and cross-run bookkeeping
+        if num_users == 1 and max_runs_per_user == 1 and not df[run_col].isna().any():
+            yield "user", self._single_run_layout(df, user_col, run_col, stage_col, order_of, style_by_stage)
+            return
+        
+        # Aggregate stages per (user, run) in one groupby instead of iterating rows
+        runs_by_user = self._collect_runs(df, user_col, run_col, stage_col, order_of)
+        
+        # Process each user's data
+        y_offset = 100
+        for user in sorted(df[user_col].unique()):
+            runs_data = runs_by_user.get(user, {})
             
-            layout_width = max(2000, (len(stages_config) + 1) * 250 * 1.2)
-            layout_height = max(1500, (num_users * max_runs_per_user * 200) * 1.2)
+            # Sort runs (try numeric sort if possible)
+            try:
+                sorted_runs = sorted(runs_data.keys(), key=_run_sort_key)
+            except:
+                sorted_runs = sorted(runs_data.keys())
             
-            layout_data = {
-                "nodes": [],
-                "connections": [],
-                "layout": {
-                    "width": layout_width,
-                    "height": layout_height,
-                    "background": {
-                        "color": "black",
-                        "gridSize": 50,
-                        "gridColor": "gray", 
-                        "gridOpacity": 0.3
-                    },
-                    "stage_colors": {stage: config["color"] for stage, config in stages_config.items()}
-                },
-                "analysis": analysis  # Include analysis for reference
+            # Add Synth/Start node (use first stage name as start)
+            first_stage_name = min(order_of, key=order_of.get)
+            tree_id = f"tree_{user}"
+            synth_node = {
+                "id": f"start_{user}",
+                "label": first_stage_name,
+                "x": 50,
+                "y": y_offset + (len(sorted_runs) * 200) / 2,
+                "type": "synth",
+                "user": user,
+                "tree_id": tree_id,
+                "style": style_by_stage[first_stage_name]
             }
             
-            # Process each user's data
-            y_offset = 100
-            for user in sorted(df[user_col].unique()):
-                user_data = df[df[user_col] == user]
+            # Build this user's entries locally and hand them over in one batch
+            user_nodes = [synth_node]
+            user_connections = []
+            add_node = user_nodes.append
+            add_connection = user_connections.append
+            
+            # Process each run
+            for run_idx, run in enumerate(sorted_runs):
+                current_y = y_offset + (run_idx * 200)
+                run_data = runs_data[run]
+                stages = sorted(run_data['stages'], key=order_of.__getitem__)
                 
-                # Get runs data
-                runs_data = {}
-                for _, row in user_data.iterrows():
-                    run = str(row[run_col])
-                    stage = str(row[stage_col])
+                # Add nodes for each stage
+                prev_node = None
+                for stage in stages:
+                    node_id = f"{run}_{stage}_{user}"
                     
-                    if stage not in stages_config:
-                        logger.warning(f"Unknown stage '{stage}' found, skipping...")
-                        continue
+                    x_pos = 250 + (order_of[stage] * 250)
                     
-                    if run not in runs_data:
-                        runs_data[run] = {'stages': set(), 'first_stage': None, 'last_stage': None}
+                    node = {
+                        "id": node_id,
+                        "label": node_id,
+                        "x": x_pos,
+                        "y": current_y,
+                        "type": "stage",
+                        "stage": stage,
+                        "user": user,
+                        "tree_id": tree_id,
+                        "style": style_by_stage[stage]
+                    }
+                    add_node(node)
                     
-                    runs_data[run]['stages'].add(stage)
+                    # Connect to previous stage in same run
+                    if prev_node:
+                        add_connection({
+                            "from": prev_node["id"],
+                            "to": node["id"],
+                            "type": "straight",
+                            "tree_id": tree_id,
+                            "style": CONNECTION_STYLE
+                        })
+                    elif self._is_first_run(run, sorted_runs):
+                        # Connect first stage of first run to start node
+                        add_connection({
+                            "from": synth_node["id"],
+                            "to": node["id"],
+                            "type": "straight",
+                            "tree_id": tree_id,
+                            "style": CONNECTION_STYLE
+                        })
                     
-                    # Track first and last stage
-                    stage_order = stages_config[stage]['order']
-                    if runs_data[run]['first_stage'] is None or stage_order < stages_config[runs_data[run]['first_stage']]['order']:
-                        runs_data[run]['first_stage'] = stage
-                    if runs_data[run]['last_stage'] is None or stage_order > stages_config[runs_data[run]['last_stage']]['order']:
-                        runs_data[run]['last_stage'] = stage
-                
-                # Sort runs (try numeric sort if possible)
-                try:
-                    sorted_runs = sorted(runs_data.keys(), key=lambda x: int(re.findall(r'\d+', x)[0]) if re.findall(r'\d+', x) else 0)
-                except:
-                    sorted_runs = sorted(runs_data.keys())
+                    prev_node = node
                 
-                # Add Synth/Start node (use first stage name as start)
-                first_stage_name = min(stages_config.keys(), key=lambda x: stages_config[x]['order'])
-                synth_node = {
-                    "id": f"start_{user}",
-                    "label": first_stage_name,
-                    "x": 50,
-                    "y": y_offset + (len(sorted_runs) * 200) / 2,
-                    "type": "synth",
-                    "user": user,
-                    "tree_id": f"tree_{user}",
-                    "style": {
-                        "width": 140,
-                        "height": 50,
-                        "fill": stages_config[first_stage_name]["color"],
-                        "stroke": "white",
-                        "strokeWidth": 2,
-                        "cornerRadius": 5,
-                        "fontSize": 12,
-                        "textColor": "white"
-                    }
-                }
-                layout_data["nodes"].append(synth_node)
-                
-                # Process each run
-                node_map = {}
-                for run_idx, run in enumerate(sorted_runs):
-                    current_y = y_offset + (run_idx * 200)
-                    run_data = runs_data[run]
-                    stages = sorted(run_data['stages'], key=lambda x: stages_config[x]['order'])
+                # Connect to previous run if not first run
+                if not self._is_first_run(run, sorted_runs) and run_idx > 0:
+                    prev_run = sorted_runs[run_idx - 1]
+                    prev_run_data = runs_data[prev_run]
                     
-                    # Add nodes for each stage
-                    prev_node = None
-                    for stage in stages:
-                        stage_config = stages_config[stage]
-                        node_id = f"{run}_{stage}_{user}"
-                        
-                        x_pos = 250 + (stage_config['order'] * 250)
-                        
-                        node = {
-                            "id": node_id,
-                            "label": node_id,
-                            "x": x_pos,
-                            "y": current_y,
-                            "type": "stage",
-                            "stage": stage,
-                            "user": user,
-                            "tree_id": f"tree_{user}",
-                            "style": {
-                                "width": 140,
-                                "height": 50,
-                                "fill": stage_config["color"],
-                                "stroke": "white",
-                                "strokeWidth": 2,
-                                "cornerRadius": 5,
-                                "fontSize": 12,
-                                "textColor": "white"
-                            }
-                        }
-                        layout_data["nodes"].append(node)
-                        node_map[node_id] = node
-                        
-                        # Connect to previous stage in same run
-                        if prev_node:
-                            layout_data["connections"].append({
-                                "from": prev_node["id"],
-                                "to": node["id"],
-                                "type": "straight",
-                                "tree_id": f"tree_{user}",
-                                "style": {
-                                    "stroke": "white",
-                                    "strokeWidth": 2,
-                                    "arrowSize": 8
-                                }
-                            })
-                        elif self._is_first_run(run, sorted_runs):
-                            # Connect first stage of first run to start node
-                            layout_data["connections"].append({
-                                "from": synth_node["id"],
-                                "to": node["id"],
-                                "type": "straight",
-                                "tree_id": f"tree_{user}",
-                                "style": {
-                                    "stroke": "white",
-                                    "strokeWidth": 2,
-                                    "arrowSize": 8
-                                }
-                            })
-                        
-                        prev_node = node
+                    # Find connection point
+                    current_first_stage_order = run_data['first_order']
+                    connection_stage = None
                     
-                    # Connect to previous run if not first run
-                    if not self._is_first_run(run, sorted_runs) and run_idx > 0:
-                        prev_run = sorted_runs[run_idx - 1]
-                        prev_run_data = runs_data[prev_run]
-                        
-                        # Find connection point
-                        current_first_stage_order = stages_config[run_data['first_stage']]['order']
-                        connection_stage = None
-                        
-                        # Find stage in previous run that comes before current run's first stage
-                        for stage in prev_run_data['stages']:
-                            if stages_config[stage]['order'] < current_first_stage_order:
-                                if not connection_stage or stages_config[stage]['order'] > stages_config[connection_stage]['order']:
-                                    connection_stage = stage
+                    # Latest stage in previous run that comes before current run's first stage
+                    prev_orders = prev_run_data['sorted_orders']
+                    idx = bisect.bisect_left(prev_orders, current_first_stage_order) - 1
+                    if idx >= 0:
+                        connection_stage = prev_run_data['stage_by_order'][prev_orders[idx]]
+                    
+                    if connection_stage:
+                        from_node_id = f"{prev_run}_{connection_stage}_{user}"
+                        to_node_id = f"{run}_{run_data['first_stage']}_{user}"
                         
-                        if connection_stage:
-                            from_node_id = f"{prev_run}_{connection_stage}_{user}"
-                            to_node_id = f"{run}_{run_data['first_stage']}_{user}"
-                            
-                            layout_data["connections"].append({
-                                "from": from_node_id,
-                                "to": to_node_id,
-                                "type": "curved",
-                                "tree_id": f"tree_{user}",
-                                "style": {
-                                    "stroke": "white",
-                                    "strokeWidth": 2,
-                                    "arrowSize": 8
-                                }
-                            })
-                
-                # Update y_offset for next user
-                y_offset += (len(sorted_runs) * 200) + 400
+                        add_connection({
+                            "from": from_node_id,
+                            "to": to_node_id,
+                            "type": "curved",
+                            "tree_id": tree_id,
+                            "style": CONNECTION_STYLE
+                        })
             
-            return layout_data
+            yield "user", (user_nodes, user_connections)
             
-        except Exception as e:
-            logger.error(f"Error generating layout structure: {e}")
-            raise ValueError(f"Failed to generate layout: {str(e)}")
+            # Update y_offset for next user
+            y_offset += (len(sorted_runs) * 200) + 400
+    
+    def _single_run_layout(self, df: pd.DataFrame, user_col: str, run_col: str, stage_col: str,
+                           order_of: Dict[str, int], style_by_stage: Dict[str, Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Nodes and connections for a single user with a single run, same shape as the general path"""
+        user = df[user_col].iloc[0]
+        run = str(df[run_col].iloc[0])
+        tree_id = f"tree_{user}"
+        y_offset = 100
+        
+        stages = []
+        for stage in pd.unique(df[stage_col].astype(str).to_numpy()):
+            if stage in order_of:
+                stages.append(stage)
+            else:
+                logger.warning(f"Unknown stage '{stage}' found, skipping...")
+        stages.sort(key=order_of.__getitem__)
+        
+        first_stage_name = min(order_of, key=order_of.get)
+        prev_id = f"start_{user}"
+        nodes = [{
+            "id": prev_id,
+            "label": first_stage_name,
+            "x": 50,
+            "y": y_offset + (200 if stages else 0) / 2,
+            "type": "synth",
+            "user": user,
+            "tree_id": tree_id,
+            "style": style_by_stage[first_stage_name]
+        }]
+        connections = []
+        for stage in stages:
+            node_id = f"{run}_{stage}_{user}"
+            nodes.append({
+                "id": node_id,
+                "label": node_id,
+                "x": 250 + (order_of[stage] * 250),
+                "y": y_offset,
+                "type": "stage",
+                "stage": stage,
+                "user": user,
+                "tree_id": tree_id,
+                "style": style_by_stage[stage]
+            })
+            connections.append({
+                "from": prev_id,
+                "to": node_id,
+                "type": "straight",
+                "tree_id": tree_id,
+                "style": CONNECTION_STYLE
+            })
+            prev_id = node_id
+        return nodes, connections
+    
+    def _collect_runs(self, df: pd.DataFrame, user_col: str, run_col: str, stage_col: str,
+                      order_of: Dict[str, int]) -> Dict[Any, Dict[str, Dict[str, Any]]]:
+        """Group rows into {user: {run: {'stages', 'first_stage', 'last_stage', ...}}}, runs in order of appearance"""
+        stage_values = df[stage_col].astype(str).to_numpy()
+        
+        # Work on integer codes; factorize keeps first-appearance order and marks missing users with -1
+        user_codes, user_labels = pd.factorize(df[user_col].to_numpy())
+        run_codes, run_labels = pd.factorize(df[run_col].astype(str).to_numpy())
+        stage_codes, stage_labels = pd.factorize(stage_values)
+        
+        stage_orders = [order_of.get(stage) for stage in stage_labels]
+        for stage, order in zip(stage_labels, stage_orders):
+            if order is None:
+                logger.warning(f"Unknown stage '{stage}' found, skipping...")
+        
+        known = np.array([order is not None for order in stage_orders], dtype=bool)
+        keep = known[stage_codes] & (user_codes >= 0)
+        
+        # Only the first row of each (user, run, stage) matters: later duplicates cannot change the
+        # stage set, and a strict </> scan in row order keeps the earliest stage on order ties
+        triples = pd.DataFrame({
+            'user': user_codes[keep],
+            'run': run_codes[keep],
+            'stage': stage_codes[keep]
+        }).drop_duplicates()
+        
+        runs_by_user = {}
+        user_runs = runs_by_user.setdefault
+        runs = {}
+        for user_code, run_code, stage_code in zip(triples['user'].to_numpy(), triples['run'].to_numpy(), triples['stage'].to_numpy()):
+            stage = stage_labels[stage_code]
+            order = stage_orders[stage_code]
+            run_data = runs.get((user_code, run_code))
+            if run_data is None:
+                # Orders are stored alongside the names so later steps need no stage lookups
+                run_data = {'stages': {stage}, 'first_stage': stage, 'last_stage': stage,
+                            'first_order': order, 'last_order': order}
+                runs[(user_code, run_code)] = run_data
+                user_runs(user_labels[user_code], {})[run_labels[run_code]] = run_data
+                continue
+            run_data['stages'].add(stage)
+            if order < run_data['first_order']:
+                run_data['first_stage'], run_data['first_order'] = stage, order
+            if order > run_data['last_order']:
+                run_data['last_stage'], run_data['last_order'] = stage, order
+        
+        for run_data in runs.values():
+            stage_by_order = {order_of[stage]: stage for stage in run_data['stages']}
+            run_data['sorted_orders'] = sorted(stage_by_order)
+            run_data['stage_by_order'] = stage_by_order
+        return runs_by_user
     
     def _is_first_run(self, run: str, sorted_runs: List[str]) -> bool:
         """Check if this is the first run"""
@@ -494,4 +876,18 @@ def analyze_and_generate_layout(df: pd.DataFrame) -> Dict[str, Any]:
         
     except Exception as e:
         logger.error(f"Error in analyze_and_generate_layout: {e}")
-        raise ValueError(f"Failed to analyze and generate layout: {str(e)}")
\ No newline at end of file
+        raise ValueError(f"Failed to analyze and generate layout: {str(e)}")
+
+def analyze_and_generate_layout_many(dfs: List[pd.DataFrame]) -> List[Dict[str, Any]]:
+    """Analyze several DataFrames with their model calls overlapping instead of running back to back"""
+    if not dfs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_REQUESTS, len(dfs))) as pool:
+        return list(pool.map(analyze_and_generate_layout, dfs))
+
+def iter_layout_ndjson(df: pd.DataFrame) -> Iterator[str]:
+    """Analyze df and yield the layout as newline-delimited JSON events for streaming responses"""
+    analyzer = DataStructureAnalyzer()
+    analysis = analyzer.analyze_headers(df)
+    for kind, item in analyzer.iter_layout_events(df, analysis):
+        yield dumps_json({"type": kind, "data": item}) + "\n"
@@ -8,29 +8,217 @@ Enhanced Layout Generator - Fixes GUI architecture issues
 """
 
 import pandas as pd
+import numpy as np
 import json
 import logging
 import re
 import math
+import functools
+import os
+import sys
+import hashlib
+import bisect
+import time
+import threading
 from typing import Dict, List, Any, Optional, Tuple
-import requests
-import openpyxl
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 logger = logging.getLogger(__name__)
 
 OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL = "mistral"
 
+# After a failed call the model is treated as down for this long before it is tried again
+OLLAMA_RETRY_SECONDS = 300
+
+# Connection styles are shared by every connection of their kind; do not mutate them
+INTRA_RUN_CONNECTION_STYLE = {
+    "stroke": "white",
+    "strokeWidth": 2,
+    "arrowSize": 8
+}
+INTER_RUN_CONNECTION_STYLE = {
+    "stroke": "#FFD700",  # Gold color for inter-run connections
+    "strokeWidth": 3,
+    "arrowSize": 10,
+    "strokeDasharray": "5,5"  # Dashed line to distinguish
+}
+
+def _intern_strings(values: pd.Series) -> pd.Series:
+    """Same values with every string interned, so repeated names share one object"""
+    return values.map(lambda value: sys.intern(value) if type(value) is str else value)
+
+# Node sizing by max text length: upper bounds (inclusive) and, per bracket,
+# (font_size, char_width, min_node_width, padding); the last row covers longer text
+TEXT_LENGTH_BRACKETS = (8, 12, 16, 24)
+FONT_SIZING_TABLE = (
+    (12, 7.2, 150, 2.0),  # 12px font = ~7.2px per character, 100% padding for comfort
+    (11, 6.6, 180, 2.0),
+    (10, 6.0, 220, 2.0),
+    (9, 5.4, 280, 2.2),   # Extra padding
+    (8, 4.8, 320, 2.5)    # Generous padding for very long text
+)
+
+# Grid size by max text length; beyond the last bracket it grows with the text
+GRID_LENGTH_BRACKETS = (10, 15, 20, 25, 30)
+GRID_SIZE_TABLE = (100, 120, 140, 160, 180)
+
+DIGITS_PATTERN = re.compile(r'\d+')
+JSON_COMMENT_PATTERN = re.compile(r'//[^\n]*|/\*[\s\S]*?\*/')
+
+@functools.lru_cache(maxsize=4096)
+def smart_run_sort_key(run_name: str) -> Tuple[int, str]:
+    """Smart sorting key for run names: first number, then the name for stability; numberless runs go last"""
+    match = DIGITS_PATTERN.search(run_name)
+    return (int(match.group()) if match else 999999, run_name)
+
+class OllamaClient:
+    """Pooled keep-alive session for Ollama generate calls, with concurrent batches"""
+    
+    def __init__(self, url: str = OLLAMA_URL, model: str = MODEL, max_workers: int = 4):
+        self.url = url
+        self.model = model
+        self.max_workers = max_workers
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._down_since: Optional[float] = None
+    
+    @property
+    def session(self):
+        """HTTP session, created on first use so importing this module does not load requests"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+                    self._session = session
+        return self._session
+    
+    def is_down(self) -> bool:
+        """True while a recent call failed and the retry window has not passed"""
+        return self._down_since is not None and time.monotonic() - self._down_since < OLLAMA_RETRY_SECONDS
+    
+    def get(self, prompt: str) -> Optional[str]:
+        """Response text for one prompt, or None when the model is unavailable"""
+        if self.is_down():
+            return None
+        try:
+            response = self.session.post(self.url, json={
+                "model": self.model,
+                "prompt": prompt,
+                "stream": False
+            }, timeout=60)
+            
+            response.raise_for_status()
+            # Parse the raw body bytes directly rather than decoding to text first
+            text = loads_json(response.content).get("response", "")
+            self._down_since = None
+            return text
+        except:
+            self._down_since = time.monotonic()
+            return None
+    
+    def get_many(self, prompts: List[str]) -> List[Optional[str]]:
+        """Responses for several prompts, issued concurrently over the shared session"""
+        if len(prompts) <= 1:
+            return [self.get(prompt) for prompt in prompts]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(prompts))) as pool:
+            return list(pool.map(self.get, prompts))
+
+# Shared by every generator so connections are pooled across uploads
+_OLLAMA_CLIENT = OllamaClient()
+
+# Parsed connection analyses keyed by prompt hash: the prompt is a pure function of the
+# column roles and sampled rows, so a repeat schema never needs the model again
+# (every RUN_STATUS cache lives under ~/.cache/runstatus)
+CONNECTION_CACHE_DIR = os.path.expanduser("~/.cache/runstatus/conn_analysis")
+CONNECTION_CACHE_SIZE = 128
+_connection_cache: Dict[str, Dict[str, Any]] = {}
+
+def loads_json(text: str) -> Any:
+    """Parse JSON with orjson when installed; its errors subclass json.JSONDecodeError"""
+    return orjson.loads(text) if HAS_ORJSON else json.loads(text)
+
+def _prompt_hash(prompt: str) -> str:
+    return hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+
+def _load_connection_analysis(key: str) -> Optional[Dict[str, Any]]:
+    """Cached analysis from memory, then from disk"""
+    cached = _connection_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        with open(os.path.join(CONNECTION_CACHE_DIR, f"{key}.json")) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    _remember_connection_analysis(key, cached)
+    return cached
+
+def _remember_connection_analysis(key: str, connection_analysis: Dict[str, Any]) -> None:
+    _connection_cache[key] = connection_analysis
+    if len(_connection_cache) > CONNECTION_CACHE_SIZE:
+        del _connection_cache[next(iter(_connection_cache))]
+
+def _store_connection_analysis(key: str, connection_analysis: Dict[str, Any]) -> None:
+    _remember_connection_analysis(key, connection_analysis)
+    try:
+        os.makedirs(CONNECTION_CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CONNECTION_CACHE_DIR, f"{key}.json"), 'w') as f:
+            json.dump(connection_analysis, f)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not persist connection analysis: {e}")
+
 class EnhancedLayoutGenerator:
     """Enhanced layout generator with proper connection logic and dynamic sizing"""
     
     def __init__(self):
         self.connection_rules = {}
         self.layout_metrics = {}
+        self.client = _OLLAMA_CLIENT
     
     def analyze_connection_patterns(self, sheets_data: Dict[str, pd.DataFrame], analysis: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze connection patterns using model-based approach"""
+        # No point serializing sample data for a model that just failed
+        if self.client.is_down():
+            return self._intelligent_connection_analysis(sheets_data, analysis)
         
+        connection_prompt = self._build_connection_prompt(sheets_data, analysis)
+        key = _prompt_hash(connection_prompt)
+        cached = _load_connection_analysis(key)
+        if cached is not None:
+            logger.info("Using cached connection analysis")
+            return cached
+        
+        model_response = self._get_model_response(connection_prompt)
+        return self._parse_connection_response(model_response, sheets_data, analysis, key)
+    
+    def analyze_connection_patterns_many(self, jobs: List[Tuple[Dict[str, pd.DataFrame], Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Analyze several (sheets_data, analysis) pairs with their model calls issued together"""
+        if self.client.is_down():
+            return [self._intelligent_connection_analysis(sheets_data, analysis) for sheets_data, analysis in jobs]
+        
+        prompts = [self._build_connection_prompt(sheets_data, analysis) for sheets_data, analysis in jobs]
+        keys = [_prompt_hash(prompt) for prompt in prompts]
+        results = [_load_connection_analysis(key) for key in keys]
+        
+        # Only the cache misses go to the model
+        missing = [idx for idx, result in enumerate(results) if result is None]
+        for idx, response in zip(missing, self.client.get_many([prompts[idx] for idx in missing])):
+            sheets_data, analysis = jobs[idx]
+            results[idx] = self._parse_connection_response(response, sheets_data, analysis, keys[idx])
+        return results
+    
+    def _build_connection_prompt(self, sheets_data: Dict[str, pd.DataFrame], analysis: Dict[str, Any]) -> str:
+        """Connection analysis prompt covering every sheet"""
         user_col = analysis["user_column"]
         run_col = analysis["run_column"]
         stage_col = analysis["stage_column"]
@@ -87,13 +275,16 @@ class EnhancedLayoutGenerator:
             }}
         }}
         """
-        
-        # Get model response
-        model_response = self._get_model_response(connection_prompt)
-        
+        return connection_prompt
+    
+    def _parse_connection_response(self, model_response: Optional[str], sheets_data: Dict[str, pd.DataFrame],
+                                   analysis: Dict[str, Any], cache_key: Optional[str] = None) -> Dict[str, Any]:
+        """Parsed model answer, or the intelligent fallback when it is missing or malformed"""
         if model_response:
             try:
                 connection_analysis = self._clean_json_response(model_response)
+                if cache_key:
+                    _store_connection_analysis(cache_key, connection_analysis)
                 return connection_analysis
             except Exception as e:
                 logger.warning(f"Failed to parse connection analysis: {e}")
@@ -107,35 +298,28 @@ class EnhancedLayoutGenerator:
         
         for sheet_name, df in sheets_data.items():
             if all(col in df.columns for col in [user_col, run_col, stage_col]):
-                # Get sample for each user
-                for user in df[user_col].unique()[:2]:  # Limit to 2 users for analysis
-                    user_data = df[df[user_col] == user]
+                # Get sample for each user, taking only the first ten rows instead of slicing the whole user frame
+                user_values = df[user_col].to_numpy()
+                for user in df[user_col].drop_duplicates().head(2):  # Limit to 2 users for analysis
+                    rows = np.flatnonzero(user_values == user)[:10]
                     sample_data.append({
                         "sheet": sheet_name,
                         "user": user,
-                        "runs_and_stages": user_data[[run_col, stage_col]].to_dict('records')[:10]
+                        "runs_and_stages": df.iloc[rows][[run_col, stage_col]].to_dict('records')
                     })
         
-        return json.dumps(sample_data, indent=2)
+        if HAS_ORJSON:
+            return orjson.dumps(sample_data, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode()
+        return json.dumps(sample_data, indent=2, default=str)
     
     def _get_model_response(self, prompt: str) -> Optional[str]:
         """Get response from model"""
-        try:
-            response = requests.post(OLLAMA_URL, json={
-                "model": MODEL,
-                "prompt": prompt,
-                "stream": False
-            }, timeout=60)
-            
-            response.raise_for_status()
-            return response.json().get("response", "")
-        except:
-            return None
+        return self.client.get(prompt)
     
     def _clean_json_response(self, response: str) -> Dict[str, Any]:
         """Clean and extract JSON from model response"""
         try:
-            return json.loads(response)
+            return loads_json(response)
         except json.JSONDecodeError:
             # Clean response
             cleaned = response
@@ -144,16 +328,17 @@ class EnhancedLayoutGenerator:
             if "```" in cleaned:
                 cleaned = cleaned.split("```")[0]
             
-            cleaned = re.sub(r'//.*?\n|/\*.*?\*/', '', cleaned, flags=re.DOTALL)
+            if '//' in cleaned or '/*' in cleaned:
+                cleaned = JSON_COMMENT_PATTERN.sub('', cleaned)
             cleaned = cleaned.strip()
             
             try:
-                return json.loads(cleaned)
+                return loads_json(cleaned)
             except:
                 start = cleaned.find('{')
                 end = cleaned.rfind('}') + 1
                 if start >= 0 and end > start:
-                    return json.loads(cleaned[start:end])
+                    return loads_json(cleaned[start:end])
                 raise ValueError("Could not extract valid JSON")
     
     def _intelligent_connection_analysis(self, sheets_data: Dict[str, pd.DataFrame], analysis: Dict[str, Any]) -> Dict[str, Any]:
@@ -198,53 +383,51 @@ class EnhancedLayoutGenerator:
         run_col = analysis["run_column"]
         stage_col = analysis["stage_column"]
         
-        # Analyze text lengths across all data
-        all_text_lengths = []
+        # Analyze text lengths across all data, keeping running totals instead of every length
+        running_max = 0
+        total_length = 0
+        total_count = 0
         max_text_per_column = {}
         
+        # User/run counts for layout sizing are gathered in the same pass over the sheets
+        total_users = 0
+        max_runs_per_user = 0
+        
         for sheet_name, df in sheets_data.items():
+            if user_col in df.columns:
+                is_block = df[user_col].astype(str).str.lower().str.startswith('block').to_numpy()
+                user_rows = df[~is_block]
+                total_users += user_rows[user_col].nunique(dropna=False)
+                if run_col in df.columns:
+                    runs_per_user = user_rows.groupby(user_col, sort=False)[run_col].nunique()
+                    if len(runs_per_user):
+                        max_runs_per_user = max(max_runs_per_user, int(runs_per_user.max()))
+                elif len(user_rows):
+                    max_runs_per_user = max(max_runs_per_user, 1)
+            
             for col in [user_col, run_col, stage_col]:
                 if col in df.columns:
-                    lengths = df[col].astype(str).str.len()
-                    all_text_lengths.extend(lengths.tolist())
-                    max_text_per_column[f"{sheet_name}_{col}"] = lengths.max()
-        
-        max_text_length = max(all_text_lengths) if all_text_lengths else 10
-        avg_text_length = sum(all_text_lengths) / len(all_text_lengths) if all_text_lengths else 8
+                    lengths = df[col].astype(str).str.len().to_numpy()
+                    if lengths.size:
+                        column_max = int(lengths.max())
+                        running_max = max(running_max, column_max)
+                        total_length += int(lengths.sum())
+                        total_count += lengths.size
+                    else:
+                        column_max = math.nan
+                    max_text_per_column[f"{sheet_name}_{col}"] = column_max
+        
+        max_text_length = running_max if total_count else 10
+        avg_text_length = total_length / total_count if total_count else 8
         
         # MANUAL PRECISE GRID SIZING CALCULATION (No Model)
         # Analyze actual text space requirements
         
-        # Font size to pixel width mapping (more accurate)
-        font_size_to_char_width = {
-            12: 7.2,  # 12px font = ~7.2px per character
-            11: 6.6,  # 11px font = ~6.6px per character  
-            10: 6.0,  # 10px font = ~6.0px per character
-            9: 5.4,   # 9px font = ~5.4px per character
-            8: 4.8    # 8px font = ~4.8px per character
-        }
-        
         # Calculate optimal node dimensions based on text length with generous padding
-        if max_text_length <= 8:
-            font_size = 12
-            char_width = font_size_to_char_width[12]
-            node_width = max(150, int(max_text_length * char_width * 2.0))  # 100% padding for comfort
-        elif max_text_length <= 12:
-            font_size = 11
-            char_width = font_size_to_char_width[11]
-            node_width = max(180, int(max_text_length * char_width * 2.0))
-        elif max_text_length <= 16:
-            font_size = 10
-            char_width = font_size_to_char_width[10]
-            node_width = max(220, int(max_text_length * char_width * 2.0))
-        elif max_text_length <= 24:
-            font_size = 9
-            char_width = font_size_to_char_width[9]
-            node_width = max(280, int(max_text_length * char_width * 2.2))  # Extra padding
-        else:
-            font_size = 8
-            char_width = font_size_to_char_width[8]
-            node_width = max(320, int(max_text_length * char_width * 2.5))  # Generous padding for very long text
+        font_size, char_width, min_node_width, padding = FONT_SIZING_TABLE[
+            bisect.bisect_left(TEXT_LENGTH_BRACKETS, max_text_length)
+        ]
+        node_width = max(min_node_width, int(max_text_length * char_width * padding))
         
         # Calculate node height based on text length (might need wrapping)
         estimated_text_width = max_text_length * char_width
@@ -261,16 +444,9 @@ class EnhancedLayoutGenerator:
         estimated_text_width = max_text_length * char_width
         
         # Make grid size much larger based on text length
-        if max_text_length <= 10:
-            grid_size = 100  # Short text, large grid
-        elif max_text_length <= 15:
-            grid_size = 120  # Medium text, larger grid
-        elif max_text_length <= 20:
-            grid_size = 140  # Long text, very large grid
-        elif max_text_length <= 25:
-            grid_size = 160  # Very long text, extra large grid
-        elif max_text_length <= 30:
-            grid_size = 180  # Extra long text, huge grid
+        grid_idx = bisect.bisect_left(GRID_LENGTH_BRACKETS, max_text_length)
+        if grid_idx < len(GRID_SIZE_TABLE):
+            grid_size = GRID_SIZE_TABLE[grid_idx]
         else:
             # For extremely long text, make grid proportional to text length
             grid_size = max(200, int(max_text_length * 6))  # 6px per character minimum
@@ -287,21 +463,8 @@ class EnhancedLayoutGenerator:
         spacing_y = 120  # Vertical spacing between runs
         user_separation = 200  # Space between different users
         
-        # Calculate total users and runs for layout sizing
-        total_users = 0
-        max_runs_per_user = 0
         max_stages = len(analysis.get("stages", []))
         
-        for df in sheets_data.values():
-            if user_col in df.columns:
-                users = [u for u in df[user_col].unique() if not str(u).lower().startswith('block')]
-                total_users += len(users)
-                
-                for user in users:
-                    user_data = df[df[user_col] == user]
-                    runs_count = user_data[run_col].nunique() if run_col in user_data.columns else 1
-                    max_runs_per_user = max(max_runs_per_user, runs_count)
-        
         # Calculate layout dimensions
         layout_width = max(1500, (max_stages + 2) * spacing_x + 200)
         layout_height = max(1000, total_users * max_runs_per_user * spacing_y + user_separation * total_users)
@@ -345,14 +508,14 @@ class EnhancedLayoutGenerator:
         
         # Read data
         if file_path.endswith(('.xlsx', '.xls')):
-            wb = openpyxl.load_workbook(file_path)
+            # Parse the workbook once and get every sheet back, instead of reopening it per sheet
+            raw_sheets = pd.read_excel(file_path, sheet_name=None)
             sheets_data = {}
-            for sheet_name in wb.sheetnames:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                df.columns = [col.strip() for col in df.columns]
-                for col in df.columns:
-                    if df[col].dtype == 'object':
-                        df[col] = df[col].astype(str).str.strip()
+            for sheet_name, df in raw_sheets.items():
+                df.columns = df.columns.astype(str).str.strip()
+                obj_cols = df.select_dtypes(include='object').columns
+                if len(obj_cols):
+                    df[obj_cols] = df[obj_cols].astype(str).apply(lambda s: s.str.strip())
                 df = df.dropna(how='all')
                 if not df.empty:
                     sheets_data[sheet_name] = df
@@ -360,6 +523,12 @@ class EnhancedLayoutGenerator:
             df = pd.read_csv(file_path)
             sheets_data = {'main': df}
         
+        # Names repeat on every node of a user/run/stage; intern them once here so the nodes share them
+        for df in sheets_data.values():
+            for col in (analysis["user_column"], analysis["run_column"], analysis["stage_column"]):
+                if col in df.columns and df[col].dtype == object:
+                    df[col] = _intern_strings(df[col])
+        
         # Analyze connection patterns
         connection_analysis = self.analyze_connection_patterns(sheets_data, analysis)
         
@@ -371,6 +540,8 @@ class EnhancedLayoutGenerator:
         run_col = analysis["run_column"]
         stage_col = analysis["stage_column"]
         stages_config = {s["name"]: s for s in analysis["stages"]}
+        stage_order = {name: config['order'] for name, config in stages_config.items()}
+        stage_color = {name: config['color'] for name, config in stages_config.items()}
         starting_block = analysis.get("starting_block", {})
         
         # Layout parameters from metrics
@@ -398,7 +569,7 @@ class EnhancedLayoutGenerator:
                     "gridColor": "gray",
                     "gridOpacity": 0.3
                 },
-                "stage_colors": {stage: config["color"] for stage, config in stages_config.items()}
+                "stage_colors": stage_color
             },
             "config": {
                 "node_width": node_width,
@@ -415,124 +586,150 @@ class EnhancedLayoutGenerator:
             "layout_metrics": layout_metrics
         }
         
-        # Process each sheet
-        current_y_offset = 100
-        all_user_flows = {}  # Track all user flows for proper separation
+        # One style dict per stage, shared by reference by all of that stage's nodes
+        style_by_stage = {
+            name: {
+                "width": node_width,
+                "height": node_height,
+                "fill": color,
+                "stroke": "white",
+                "strokeWidth": 2,
+                "cornerRadius": 5,
+                "fontSize": font_size,
+                "textColor": "white"
+            }
+            for name, color in stage_color.items()
+        }
         
-        for sheet_idx, (sheet_name, df) in enumerate(sheets_data.items()):
-            logger.info(f"Processing sheet: {sheet_name}")
-            
-            # Add starting block for this sheet
-            if starting_block and sheet_name == starting_block.get("sheet", list(sheets_data.keys())[0]):
-                block_node = {
-                    "id": f"block_{sheet_name}",
-                    "label": starting_block.get("label", "ETH_SBS"),
-                    "x": 50,
-                    "y": current_y_offset,
-                    "type": "block",
-                    "sheet": sheet_name,
-                    "tree_id": f"tree_{sheet_name}",
-                    "style": {
-                        "width": node_width,
-                        "height": node_height,
-                        "fill": "#2C3E50",
-                        "stroke": "white",
-                        "strokeWidth": 3,
-                        "cornerRadius": 8,
-                        "fontSize": font_size,
-                        "textColor": "white",
-                        "fontWeight": "bold"
-                    }
-                }
-                layout_data["nodes"].append(block_node)
-            
-            # Process users in this sheet
+        # Pass 1: users per sheet, so each sheet's y offset is a prefix sum known up front
+        sheet_jobs = []
+        first_sheet = next(iter(sheets_data), None)
+        current_y_offset = 100
+        for sheet_name, df in sheets_data.items():
+            users = []
             if user_col in df.columns:
                 users = [user for user in df[user_col].unique() if not str(user).lower().startswith('block')]
-                
-                for user_idx, user in enumerate(sorted(users)):
-                    user_key = f"{sheet_name}_{user}"
-                    user_data = df[df[user_col] == user]
-                    
-                    # Calculate user's Y position
-                    user_y_offset = current_y_offset + (user_idx * user_separation)
-                    
-                    # Analyze runs for this user
-                    runs_analysis = self._analyze_user_runs(user_data, run_col, stage_col, stages_config)
-                    
-                    # Store user flow for connection analysis
-                    all_user_flows[user_key] = {
-                        "runs": runs_analysis,
-                        "y_offset": user_y_offset,
-                        "sheet": sheet_name,
-                        "user": user
-                    }
-                    
-                    # Generate nodes and connections for this user
-                    self._generate_user_flow(
-                        layout_data, user_key, runs_analysis, stages_config,
-                        user_y_offset, spacing_x, spacing_y, node_width, node_height, font_size,
-                        starting_block, sheet_name
-                    )
-            
-            # Update y_offset for next sheet
+            sheet_jobs.append((sheet_name, df, users, current_y_offset))
             if users:  # Only if there were users in this sheet
                 current_y_offset += len(users) * user_separation + 300  # Extra space between sheets
         
+        # Pass 2: sheets are independent once their offsets are fixed, so build them concurrently
+        def process(job):
+            sheet_name, df, users, base_y_offset = job
+            return self._process_sheet(
+                sheet_name, df, users, base_y_offset, user_col, run_col, stage_col,
+                stage_order, style_by_stage, starting_block, first_sheet,
+                node_width, node_height, font_size, spacing_x, spacing_y, user_separation
+            )
+        
+        if len(sheet_jobs) > 1:
+            with ThreadPoolExecutor(max_workers=min(8, len(sheet_jobs))) as pool:
+                sheet_results = list(pool.map(process, sheet_jobs))
+        else:
+            sheet_results = [process(job) for job in sheet_jobs]
+        
+        # Merge in sheet order so the output is deterministic
+        all_user_flows = {}  # Track all user flows for proper separation
+        for sheet_layout, sheet_flows in sheet_results:
+            layout_data["nodes"].extend(sheet_layout["nodes"])
+            layout_data["connections"].extend(sheet_layout["connections"])
+            all_user_flows.update(sheet_flows)
+        
         logger.info(f"Enhanced layout generated: {len(layout_data['nodes'])} nodes, {len(layout_data['connections'])} connections")
         return layout_data
     
-    def _analyze_user_runs(self, user_data: pd.DataFrame, run_col: str, stage_col: str, stages_config: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze runs for a specific user"""
+    def _process_sheet(self, sheet_name: str, df: pd.DataFrame, users: List[Any], base_y_offset: float,
+                       user_col: str, run_col: str, stage_col: str, stage_order: Dict[str, Any],
+                       style_by_stage: Dict[str, Dict[str, Any]], starting_block: Dict[str, Any],
+                       first_sheet: str, node_width: float, node_height: float, font_size: float,
+                       spacing_x: float, spacing_y: float, user_separation: float) -> Tuple[Dict[str, List], Dict[str, Any]]:
+        """Build the nodes and connections of one sheet, starting at base_y_offset"""
+        logger.info(f"Processing sheet: {sheet_name}")
+        sheet_layout = {"nodes": [], "connections": []}
+        user_flows = {}
+        
+        # Add starting block for this sheet
+        if starting_block and sheet_name == starting_block.get("sheet", first_sheet):
+            block_node = {
+                "id": f"block_{sheet_name}",
+                "label": starting_block.get("label", "ETH_SBS"),
+                "x": 50,
+                "y": base_y_offset,
+                "type": "block",
+                "sheet": sheet_name,
+                "tree_id": f"tree_{sheet_name}",
+                "style": {
+                    "width": node_width,
+                    "height": node_height,
+                    "fill": "#2C3E50",
+                    "stroke": "white",
+                    "strokeWidth": 3,
+                    "cornerRadius": 8,
+                    "fontSize": font_size,
+                    "textColor": "white",
+                    "fontWeight": "bold"
+                }
+            }
+            sheet_layout["nodes"].append(block_node)
         
-        runs_data = {}
+        if not users:
+            return sheet_layout, user_flows
         
-        # Collect run data
-        for _, row in user_data.iterrows():
-            run = str(row[run_col])
-            stage = str(row[stage_col])
+        # Split the sheet by user in one pass instead of a boolean scan per user
+        user_frames = dict(iter(df[df[user_col].isin(users)].groupby(user_col, sort=False)))
+        
+        for user_idx, user in enumerate(sorted(users)):
+            user_key = f"{sheet_name}_{user}"
+            user_data = user_frames.get(user, df.iloc[:0])
             
-            if stage not in stages_config:
-                continue
+            # Calculate user's Y position
+            user_y_offset = base_y_offset + (user_idx * user_separation)
             
-            if run not in runs_data:
-                runs_data[run] = {
-                    'stages': [],
-                    'first_stage': None,
-                    'last_stage': None,
-                    'stage_orders': []
-                }
+            # Analyze runs for this user
+            runs_analysis = self._analyze_user_runs(user_data, run_col, stage_col, stage_order)
             
-            if stage not in runs_data[run]['stages']:
-                runs_data[run]['stages'].append(stage)
-                runs_data[run]['stage_orders'].append(stages_config[stage]['order'])
-        
-        # Sort stages within each run and determine first/last
-        for run in runs_data:
-            # Sort stages by order
-            stage_order_pairs = list(zip(runs_data[run]['stages'], runs_data[run]['stage_orders']))
-            stage_order_pairs.sort(key=lambda x: x[1])
+            # Store user flow for connection analysis
+            user_flows[user_key] = {
+                "runs": runs_analysis,
+                "y_offset": user_y_offset,
+                "sheet": sheet_name,
+                "user": user
+            }
             
-            runs_data[run]['stages'] = [stage for stage, _ in stage_order_pairs]
-            runs_data[run]['first_stage'] = runs_data[run]['stages'][0] if runs_data[run]['stages'] else None
-            runs_data[run]['last_stage'] = runs_data[run]['stages'][-1] if runs_data[run]['stages'] else None
-        
-        # Enhanced run sorting logic
-        def smart_run_sort_key(run_name):
-            """Smart sorting key for run names"""
-            # Extract all numbers from the run name
-            numbers = re.findall(r'\d+', run_name)
-            if numbers:
-                # Use the first number as primary sort key
-                primary_num = int(numbers[0])
-                # Use the run name as secondary key for stability
-                return (primary_num, run_name)
-            else:
-                # No numbers found, sort alphabetically but put at end
-                return (999999, run_name)
+            # Generate nodes and connections for this user
+            self._generate_user_flow(
+                sheet_layout, user_key, runs_analysis, stage_order,
+                user_y_offset, spacing_x, spacing_y, style_by_stage,
+                starting_block, sheet_name
+            )
+        
+        return sheet_layout, user_flows
+    
+    def _analyze_user_runs(self, user_data: pd.DataFrame, run_col: str, stage_col: str, stage_order: Dict[str, Any]) -> Dict[str, Any]:
+        """Analyze runs for a specific user"""
+        
+        # Known stages only, first occurrence of each (run, stage) pair, ordered by stage order;
+        # the stable sort keeps first-appearance order between stages sharing an order
+        stage_values = user_data[stage_col].astype(str)
+        orders = stage_values.map(stage_order)
+        known = orders.notna().to_numpy()
+        ud = pd.DataFrame({
+            'run': user_data[run_col].astype(str).to_numpy()[known],
+            'stage': stage_values.to_numpy()[known],
+            'order': orders.to_numpy()[known]
+        }).drop_duplicates(['run', 'stage']).sort_values('order', kind='stable')
+        
+        runs_data = {}
+        for run, stages in ud.groupby('run', sort=False)['stage'].agg(list).items():
+            runs_data[run] = {
+                'stages': stages,
+                'first_stage': stages[0],
+                'last_stage': stages[-1],
+                'stage_orders': [stage_order[stage] for stage in stages]
+            }
         
         try:
-            sorted_runs = sorted(runs_data.keys(), key=smart_run_sort_key)
+            sorted_runs = sorted(runs_data, key=smart_run_sort_key)
         except:
             sorted_runs = sorted(runs_data.keys())
         
@@ -543,8 +740,8 @@ class EnhancedLayoutGenerator:
         }
     
     def _generate_user_flow(self, layout_data: Dict[str, Any], user_key: str, runs_analysis: Dict[str, Any], 
-                           stages_config: Dict[str, Any], user_y_offset: int, spacing_x: int, spacing_y: int,
-                           node_width: int, node_height: int, font_size: int, starting_block: Dict[str, Any], sheet_name: str):
+                           stage_order: Dict[str, Any], user_y_offset: int, spacing_x: int, spacing_y: int,
+                           style_by_stage: Dict[str, Dict[str, Any]], starting_block: Dict[str, Any], sheet_name: str):
         """Generate nodes and connections for a specific user's flow"""
         
         runs_data = runs_analysis["runs_data"]
@@ -552,6 +749,15 @@ class EnhancedLayoutGenerator:
         
         user = user_key.split('_', 1)[1]  # Extract user name from user_key
         
+        # Collect locally and extend the layout lists once for this user
+        local_nodes = []
+        local_conns = []
+        
+        # Id parts shared by every node of this user, formatted once
+        user_suffix = f"_{user}"
+        tree_id = sys.intern(f"tree_{sheet_name}_{user}")
+        block_id = f"block_{sheet_name}"
+        
         # Track previous run's last node for inter-run connections
         prev_run_last_node = None
         
@@ -561,6 +767,7 @@ class EnhancedLayoutGenerator:
             
             # Calculate Y position for this run
             run_y = user_y_offset + (run_idx * spacing_y)
+            run_prefix = f"{sheet_name}_{run}_"
             
             # Track previous node within this run
             prev_stage_node = None
@@ -568,11 +775,10 @@ class EnhancedLayoutGenerator:
             run_last_node = None
             
             for stage_idx, stage in enumerate(stages):
-                stage_config = stages_config[stage]
-                node_id = f"{sheet_name}_{run}_{stage}_{user}"
+                node_id = run_prefix + stage + user_suffix
                 
                 # Calculate X position based on stage order
-                x_pos = spacing_x + (stage_config['order'] * spacing_x)
+                x_pos = spacing_x + (stage_order[stage] * spacing_x)
                 
                 node = {
                     "id": node_id,
@@ -586,19 +792,10 @@ class EnhancedLayoutGenerator:
                     "run_index": run_idx,
                     "stage_index": stage_idx,
                     "sheet": sheet_name,
-                    "tree_id": f"tree_{sheet_name}_{user}",
-                    "style": {
-                        "width": node_width,
-                        "height": node_height,
-                        "fill": stage_config["color"],
-                        "stroke": "white",
-                        "strokeWidth": 2,
-                        "cornerRadius": 5,
-                        "fontSize": font_size,
-                        "textColor": "white"
-                    }
+                    "tree_id": tree_id,
+                    "style": style_by_stage[stage]
                 }
-                layout_data["nodes"].append(node)
+                local_nodes.append(node)
                 
                 # Track first and last nodes of this run
                 if stage_idx == 0:
@@ -608,54 +805,44 @@ class EnhancedLayoutGenerator:
                 
                 # INTRA-RUN CONNECTIONS: Connect to previous stage in same run
                 if prev_stage_node:
-                    layout_data["connections"].append({
+                    local_conns.append({
                         "from": prev_stage_node["id"],
                         "to": node["id"],
                         "type": "straight",
                         "connection_category": "intra_run",
-                        "tree_id": f"tree_{sheet_name}_{user}",
-                        "style": {
-                            "stroke": "white",
-                            "strokeWidth": 2,
-                            "arrowSize": 8
-                        }
+                        "tree_id": tree_id,
+                        "style": INTRA_RUN_CONNECTION_STYLE
                     })
                 
                 # BLOCK CONNECTION: First stage of first run connects to block
                 elif run_idx == 0 and stage_idx == 0 and starting_block:
-                    layout_data["connections"].append({
-                        "from": f"block_{sheet_name}",
+                    local_conns.append({
+                        "from": block_id,
                         "to": node["id"],
                         "type": "straight",
                         "connection_category": "block_to_first",
-                        "tree_id": f"tree_{sheet_name}_{user}",
-                        "style": {
-                            "stroke": "white",
-                            "strokeWidth": 2,
-                            "arrowSize": 8
-                        }
+                        "tree_id": tree_id,
+                        "style": INTRA_RUN_CONNECTION_STYLE
                     })
                 
                 prev_stage_node = node
             
             # INTER-RUN CONNECTIONS: Connect last stage of previous run to first stage of current run
             if prev_run_last_node and run_first_node:
-                layout_data["connections"].append({
+                local_conns.append({
                     "from": prev_run_last_node["id"],
                     "to": run_first_node["id"],
                     "type": "curved",
                     "connection_category": "inter_run",
-                    "tree_id": f"tree_{sheet_name}_{user}",
-                    "style": {
-                        "stroke": "#FFD700",  # Gold color for inter-run connections
-                        "strokeWidth": 3,
-                        "arrowSize": 10,
-                        "strokeDasharray": "5,5"  # Dashed line to distinguish
-                    }
+                    "tree_id": tree_id,
+                    "style": INTER_RUN_CONNECTION_STYLE
                 })
             
             # Update previous run's last node
             prev_run_last_node = run_last_node
+        
+        layout_data["nodes"].extend(local_nodes)
+        layout_data["connections"].extend(local_conns)
 
 # Main function to replace the previous analyzer
 def analyze_and_generate_advanced_layout(file_path: str) -> Dict[str, Any]:
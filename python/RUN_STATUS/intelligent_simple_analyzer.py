@@ -7,10 +7,10 @@ Model-based analysis without external dependencies
 import json
 import csv
 import sys
-import os
-from typing import Dict, List, Any, Optional
-from collections import defaultdict, Counter
+import math
+from typing import Dict, List, Any, Optional, Tuple, Callable
 import re
+from itertools import islice
 
 class IntelligentSimpleFlowAnalyzer:
     def __init__(self):
@@ -29,6 +29,8 @@ class IntelligentSimpleFlowAnalyzer:
         self.user_patterns = ['user', 'owner', 'designer', 'engineer', 'creator']
         self.run_patterns = ['run', 'flow', 'job', 'batch', 'iteration', 'id']
         self.status_patterns = ['status', 'state', 'result', 'outcome', 'condition']
+        self.stage_column_keywords = ['stage', 'step', 'phase', 'task', 'tool', 'process']
+        self.time_keywords = ['time', 'date', 'timestamp', 'created', 'updated']
         
         self.status_mapping = {
             'completed': ['complete', 'done', 'success', 'pass', 'finished', 'ok'],
@@ -36,6 +38,54 @@ class IntelligentSimpleFlowAnalyzer:
             'running': ['run', 'active', 'progress', 'executing', 'processing'],
             'pending': ['pending', 'wait', 'queue', 'scheduled', 'ready']
         }
+        
+        # One compiled alternation per category replaces the per-keyword substring loops.
+        # Stage/status keywords must start a word, so 'rt' no longer hits 'start' or 'pl' hits 'replace'
+        self._stage_regexes = {
+            stage_type: self._keyword_regex(patterns, word_start=True)
+            for stage_type, patterns in self.stage_patterns.items()
+        }
+        self._status_regexes = {
+            status: self._keyword_regex(patterns, word_start=True)
+            for status, patterns in self.status_mapping.items()
+        }
+        # Column-name categories, checked in this order
+        self._column_name_regexes = {
+            'user': self._keyword_regex(self.user_patterns),
+            'run': self._keyword_regex(self.run_patterns),
+            'status': self._keyword_regex(self.status_patterns)
+        }
+        self._stage_column_regex = self._keyword_regex(self.stage_column_keywords)
+        self._time_column_regex = self._keyword_regex(self.time_keywords)
+        
+        # Stage/status strings repeat heavily; remember each lowered value's category.
+        # Seeding with the keywords themselves (resolved by the same scan, so overlapping
+        # keywords keep their first-category answer) makes exact keyword values a single lookup.
+        self._stage_type_cache: Dict[str, str] = {
+            keyword: self._first_match(keyword, self._stage_regexes, 'process')
+            for patterns in self.stage_patterns.values() for keyword in patterns
+        }
+        self._status_cache: Dict[str, str] = {
+            keyword: self._first_match(keyword, self._status_regexes, 'unknown')
+            for patterns in self.status_mapping.values() for keyword in patterns
+        }
+
+    @staticmethod
+    def _keyword_regex(keywords: List[str], word_start: bool = False) -> re.Pattern:
+        """Regex matching any of the keywords as a substring, optionally only at the start of a word"""
+        alternation = '|'.join(map(re.escape, keywords))
+        if word_start:
+            # Words are runs of lowercase letters and digits, as in 'place_opt' or 'route-2'
+            return re.compile(f'(?<![a-z0-9])(?:{alternation})')
+        return re.compile(alternation)
+
+    @staticmethod
+    def _first_match(value: str, regexes: Dict[str, re.Pattern], default: Optional[str]) -> Optional[str]:
+        """First category, in table order, whose keywords occur in value"""
+        for category, regex in regexes.items():
+            if regex.search(value):
+                return category
+        return default
 
     def read_csv_data(self, file_path: str) -> List[Dict[str, Any]]:
         """Read CSV data safely"""
@@ -49,6 +99,18 @@ class IntelligentSimpleFlowAnalyzer:
         except Exception as e:
             raise ValueError(f"Error reading CSV file: {str(e)}")
 
+    def read_csv_sample(self, file_path: str, limit: int = 10) -> Tuple[List[Dict[str, Any]], int]:
+        """Read only the first `limit` rows as dicts and count the rest without building them"""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                reader = csv.DictReader(file)
+                sample = [dict(row) for row in islice(reader, limit)]
+                # DictReader skips blank records, so count the remaining ones the same way
+                remaining = sum(1 for row in reader.reader if row)
+            return sample, len(sample) + remaining
+        except Exception as e:
+            raise ValueError(f"Error reading CSV file: {str(e)}")
+
     def analyze_column_types(self, data: List[Dict[str, Any]]) -> Dict[str, str]:
         """Intelligently detect column types based on content and patterns"""
         if not data:
@@ -62,12 +124,9 @@ class IntelligentSimpleFlowAnalyzer:
             sample_values = [str(row.get(col, '')).lower() for row in data[:10]]
             
             # Analyze column content
-            if any(pattern in col_lower for pattern in self.user_patterns):
-                column_analysis[col] = 'user'
-            elif any(pattern in col_lower for pattern in self.run_patterns):
-                column_analysis[col] = 'run'
-            elif any(pattern in col_lower for pattern in self.status_patterns):
-                column_analysis[col] = 'status'
+            name_type = self._first_match(col_lower, self._column_name_regexes, None)
+            if name_type:
+                column_analysis[col] = name_type
             elif self._is_stage_column(col_lower, sample_values):
                 column_analysis[col] = 'stage'
             elif self._is_timestamp_column(col_lower, sample_values):
@@ -79,95 +138,118 @@ class IntelligentSimpleFlowAnalyzer:
 
     def _is_stage_column(self, col_name: str, sample_values: List[str]) -> bool:
         """Check if column contains stage information"""
-        stage_keywords = ['stage', 'step', 'phase', 'task', 'tool', 'process']
-        
         # Check column name
-        if any(keyword in col_name for keyword in stage_keywords):
+        if self._stage_column_regex.search(col_name):
             return True
         
-        # Check sample values for stage patterns
+        # Check sample values for stage patterns, stopping once the 30% threshold is met or out of reach
+        required = math.ceil(len(sample_values) * 0.3)
         stage_matches = 0
-        for value in sample_values:
-            for stage_type, patterns in self.stage_patterns.items():
-                if any(pattern in value for pattern in patterns):
-                    stage_matches += 1
-                    break
+        for idx, value in enumerate(sample_values):
+            if stage_matches >= required:
+                return True
+            if stage_matches + len(sample_values) - idx < required:
+                return False
+            if self._stage_type_of(value) != 'process':
+                stage_matches += 1
         
-        return stage_matches >= len(sample_values) * 0.3  # 30% threshold
+        return stage_matches >= required
 
     def _is_timestamp_column(self, col_name: str, sample_values: List[str]) -> bool:
         """Check if column contains timestamp information"""
-        time_keywords = ['time', 'date', 'timestamp', 'created', 'updated']
-        return any(keyword in col_name for keyword in time_keywords)
+        return bool(self._time_column_regex.search(col_name))
 
     def detect_stage_type(self, stage_value: str) -> str:
         """Detect the type of stage based on value"""
-        stage_lower = str(stage_value).lower()
-        
-        for stage_type, patterns in self.stage_patterns.items():
-            if any(pattern in stage_lower for pattern in patterns):
-                return stage_type
-        
-        return 'process'  # Default type
+        return self._stage_type_of(str(stage_value).lower())
+
+    def _stage_type_of(self, stage_lower: str) -> str:
+        """Cached stage type for an already lower-cased value"""
+        stage_type = self._stage_type_cache.get(stage_lower)
+        if stage_type is None:
+            stage_type = self._first_match(stage_lower, self._stage_regexes, 'process')  # Default type
+            self._stage_type_cache[stage_lower] = stage_type
+        return stage_type
 
     def normalize_status(self, status_value: str) -> str:
         """Normalize status values to standard categories"""
         status_lower = str(status_value).lower()
         
-        for normalized_status, patterns in self.status_mapping.items():
-            if any(pattern in status_lower for pattern in patterns):
-                return normalized_status
-        
-        return 'unknown'
+        normalized = self._status_cache.get(status_lower)
+        if normalized is None:
+            normalized = self._first_match(status_lower, self._status_regexes, 'unknown')
+            self._status_cache[status_lower] = normalized
+        return normalized
 
-    def create_intelligent_flow_structure(self, data: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Create tabular flow structure matching SimpleFlowVisualization format"""
+    def create_intelligent_flow_structure(self, data: List[Dict[str, Any]], total_rows: Optional[int] = None) -> Dict[str, Any]:
+        """Create tabular flow structure matching SimpleFlowVisualization format
+        
+        `data` may be just the leading rows of the file, with `total_rows` giving the full count.
+        """
         if not data:
             return self._create_empty_structure()
         
+        if total_rows is None:
+            total_rows = len(data)
         columns = list(data[0].keys())
         table_name = "Database Table"
         
-        print(f"Creating tabular flow structure with {len(columns)} columns and {len(data)} rows", file=sys.stderr)
+        print(f"Creating tabular flow structure with {len(columns)} columns and {total_rows} rows", file=sys.stderr)
+        
+        # Values repeat across rows and headers; format each distinct one once
+        display_cache: Dict[str, str] = {}
+        
+        def format_display_value(value: str) -> str:
+            display = display_cache.get(value)
+            if display is None:
+                display = display_cache[value] = self._format_display_value(value)
+            return display
         
         # Create header flow - shows column names as flow steps
-        header_flow = self._create_header_flow(columns)
+        header_flow = self._create_header_flow(columns, format_display_value)
         
         # Create data rows - each row becomes a flow showing values across columns
         data_rows = []
         for row_idx, row in enumerate(data[:10]):  # Limit to first 10 rows for performance
-            data_row = self._create_data_row_flow(row, columns, row_idx)
+            data_row = self._create_data_row_flow(row, columns, row_idx, format_display_value)
             data_rows.append(data_row)
         
         return {
             'table_name': table_name,
             'total_columns': len(columns),
-            'total_rows': len(data),
+            'total_rows': total_rows,
             'header_flow': header_flow,
             'data_rows': data_rows,
             'metadata': {
                 'analyzed_at': self._get_current_timestamp(),
-                'total_rows_analyzed': len(data),
+                'total_rows_analyzed': total_rows,
                 'analysis_type': 'intelligent_tabular_flow',
-                'description': f'Tabular flow analysis of {len(data)} rows across {len(columns)} columns'
+                'description': f'Tabular flow analysis of {total_rows} rows across {len(columns)} columns'
             }
         }
 
-    def _create_header_flow(self, columns: List[str]) -> Dict[str, Any]:
-        """Create header flow showing column names"""
-        flow_steps = []
-        
-        for idx, column in enumerate(columns):
-            step_id = f"header_step_{idx}"
-            flow_steps.append({
-                'id': step_id,
+    def _flow_steps(self, id_prefix: str, columns: List[str], values: List[str],
+                    format_display_value: Optional[Callable[[str], str]] = None) -> List[Dict[str, Any]]:
+        """Flow step dicts for one row of values, one step per column"""
+        format_display_value = format_display_value or self._format_display_value
+        last_idx = len(columns) - 1
+        return [
+            {
+                'id': f"{id_prefix}{idx}",
                 'position': idx,
                 'column_name': column,
-                'value': column,
-                'display_value': self._format_display_value(column),
+                'value': value,
+                'display_value': format_display_value(value),
                 'is_first': idx == 0,
-                'is_last': idx == len(columns) - 1
-            })
+                'is_last': idx == last_idx
+            }
+            for idx, (column, value) in enumerate(zip(columns, values))
+        ]
+
+    def _create_header_flow(self, columns: List[str],
+                            format_display_value: Optional[Callable[[str], str]] = None) -> Dict[str, Any]:
+        """Create header flow showing column names"""
+        flow_steps = self._flow_steps("header_step_", columns, columns, format_display_value)
         
         return {
             'id': 'header_flow',
@@ -177,33 +259,24 @@ class IntelligentSimpleFlowAnalyzer:
             'complete_flow': flow_steps
         }
 
-    def _create_data_row_flow(self, row: Dict[str, Any], columns: List[str], row_idx: int) -> Dict[str, Any]:
+    def _create_data_row_flow(self, row: Dict[str, Any], columns: List[str], row_idx: int,
+                              format_display_value: Optional[Callable[[str], str]] = None) -> Dict[str, Any]:
         """Create data row flow showing values across columns"""
-        flow_steps = []
+        format_display_value = format_display_value or self._format_display_value
         
         # Get the first column value as the row identifier
         first_col_value = str(row.get(columns[0], f'Row {row_idx + 1}'))
         
-        for idx, column in enumerate(columns):
-            step_id = f"row_{row_idx}_step_{idx}"
-            raw_value = row.get(column, '')
-            
-            flow_steps.append({
-                'id': step_id,
-                'position': idx,
-                'column_name': column,
-                'value': str(raw_value),
-                'display_value': self._format_display_value(str(raw_value)),
-                'is_first': idx == 0,
-                'is_last': idx == len(columns) - 1
-            })
+        # Each cell is stringified once and reused for both the value and its display form
+        values = [str(row.get(column, '')) for column in columns]
+        flow_steps = self._flow_steps(f"row_{row_idx}_step_", columns, values, format_display_value)
         
         return {
             'id': f'data_row_{row_idx}',
             'row_number': row_idx + 1,
             'type': 'data',
             'initial_value': first_col_value,
-            'initial_display': self._format_display_value(first_col_value),
+            'initial_display': format_display_value(first_col_value),
             'complete_flow': flow_steps
         }
 
@@ -212,10 +285,9 @@ class IntelligentSimpleFlowAnalyzer:
         if not value:
             return '(empty)'
         
-        value_str = str(value).strip()
-        if len(value_str) > 25:
-            return value_str[:22] + '...'
-        return value_str
+        # Cells arrive as str already; only convert anything else
+        value_str = value.strip() if type(value) is str else str(value).strip()
+        return value_str if len(value_str) <= 25 else f"{value_str[:22]}..."
 
     def _get_current_timestamp(self) -> str:
         """Get current timestamp in ISO format"""
@@ -296,12 +368,12 @@ class IntelligentSimpleFlowAnalyzer:
         try:
             print(f"Starting intelligent analysis of: {file_path}", file=sys.stderr)
             
-            # Read data
-            data = self.read_csv_data(file_path)
-            print(f"Read {len(data)} rows of data", file=sys.stderr)
+            # Read data: only the displayed rows are kept, the rest are just counted
+            data, total_rows = self.read_csv_sample(file_path)
+            print(f"Read {total_rows} rows of data", file=sys.stderr)
             
             # Create flow structure
-            result = self.create_intelligent_flow_structure(data)
+            result = self.create_intelligent_flow_structure(data, total_rows)
             print(f"Created tabular flow with {result['total_columns']} columns and {len(result['data_rows'])} data rows", file=sys.stderr)
             
             return result
@@ -320,7 +392,8 @@ def main():
     try:
         analyzer = IntelligentSimpleFlowAnalyzer()
         result = analyzer.analyze(file_path)
-        print(json.dumps(result))
+        # Compact separators; ASCII escaping is kept because the Node caller decodes stdout per chunk
+        print(json.dumps(result, separators=(',', ':')))
     except Exception as e:
         print(json.dumps({"error": str(e)}))
         sys.exit(1)
@@ -8,24 +8,30 @@ import logging
 import re
 import math
 import csv
+import importlib.util
 from typing import Dict, List, Any, Optional, Tuple
-import requests
+from simple_branch_analyzer import SimpleBranchAnalyzer
 
-# Try to import pandas and openpyxl, use fallback if not available
-try:
-    import pandas as pd
-    import openpyxl
-    HAS_PANDAS = True
-except ImportError:
-    HAS_PANDAS = False
-    pd = None
-    openpyxl = None
+# Use pandas and openpyxl when both are installed, the csv fallback otherwise. They are
+# imported on first analysis rather than here, so importing this module stays cheap.
+HAS_PANDAS = all(importlib.util.find_spec(name) is not None for name in ('pandas', 'openpyxl'))
+pd = None
+
+def _load_pandas():
+    """Import pandas on first use"""
+    global pd
+    if pd is None:
+        import pandas
+        pd = pandas
+    return pd
 
 logger = logging.getLogger(__name__)
 
 OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL = "mistral"
 
+VERSION_NUMBER_PATTERN = re.compile(r'(\d+)')
+
 class RTLViewAnalyzer:
     """Analyzes data for RTL version-based branching patterns"""
     
@@ -37,30 +43,20 @@ class RTLViewAnalyzer:
     def _read_csv_fallback(self, file_path: str) -> Dict[str, List[Dict[str, str]]]:
         """Fallback CSV reader when pandas is not available"""
         with open(file_path, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            data = list(reader)
-        
-        if not data:
-            return {}
-        
-        # Use first row as headers
-        headers = [col.strip() for col in data[0]]
-        all_rows = []
-        
-        # Process remaining rows as data
-        for row_idx, row_data in enumerate(data[1:], 1):
-            if not row_data or not any(cell.strip() for cell in row_data):
-                continue  # Skip empty rows
+            reader = csv.DictReader(f)
+            if reader.fieldnames is None:
+                return {}
             
-            # Create a row dict with proper column names
-            row_dict = {}
-            for col_idx, value in enumerate(row_data):
-                if col_idx < len(headers):
-                    col_name = headers[col_idx]
-                    row_dict[col_name] = value.strip() if value else ''
+            # Use first row as headers
+            reader.fieldnames = [col.strip() for col in reader.fieldnames]
             
-            if any(row_dict.values()):  # Skip empty rows
-                all_rows.append(row_dict)
+            # Stream rows straight into dicts; cells past the headers (None key) and
+            # missing trailing cells (None value) are left out, and empty rows skipped
+            all_rows = []
+            for row in reader:
+                row_dict = {col: value.strip() for col, value in row.items() if col is not None and value is not None}
+                if any(row_dict.values()):
+                    all_rows.append(row_dict)
         
         return {'main': all_rows}
 
@@ -70,8 +66,12 @@ class RTLViewAnalyzer:
             logger.info(f"Analyzing RTL patterns for: {file_path}")
             
             # Read data with fallback support
+            if HAS_PANDAS:
+                _load_pandas()
+            
             if HAS_PANDAS and file_path.endswith(('.xlsx', '.xls')):
                 # Use pandas for Excel files
+                import openpyxl
                 wb = openpyxl.load_workbook(file_path)
                 sheets_data = {}
                 for sheet_name in wb.sheetnames:
@@ -85,8 +85,9 @@ class RTLViewAnalyzer:
                     if not df.empty:
                         sheets_data[sheet_name] = df
             elif HAS_PANDAS:
-                # Use pandas for CSV files
-                df = pd.read_csv(file_path)
+                # Use pandas for CSV files; every value is used as text, so skip type inference
+                # (this also keeps cells like '01' or '1.50' verbatim, as the csv fallback does)
+                df = pd.read_csv(file_path, dtype=str)
                 # Clean up column names
                 df.columns = [col.strip() for col in df.columns]
                 sheets_data = {'main': df}
@@ -94,8 +95,10 @@ class RTLViewAnalyzer:
                 # Fallback CSV reader
                 sheets_data = self._read_csv_fallback(file_path)
             
-            # Check if RTL_version column exists
-            first_sheet_data = list(sheets_data.values())[0]
+            # Check if RTL_version column exists; only the first sheet is analyzed
+            if not sheets_data:
+                raise ValueError("No data found in the file")
+            first_sheet_data = next(iter(sheets_data.values()))
             
             # Get column names
             if HAS_PANDAS and hasattr(first_sheet_data, 'columns'):
@@ -118,13 +121,18 @@ class RTLViewAnalyzer:
                 raise ValueError("RTL_version column not found in the data. Please ensure your data has an RTL_version column.")
             
             # Analyze data structure
-            data_analysis = self._analyze_data_structure(sheets_data, rtl_column)
+            data_analysis = self._analyze_data_structure(first_sheet_data, rtl_column)
+            
+            # Normalize the version column once for both the version list and the grouping
+            rtl_values = None
+            if HAS_PANDAS and hasattr(first_sheet_data, 'columns'):
+                rtl_values = self._valid_rtl_values(first_sheet_data, rtl_column)
             
             # Extract RTL versions
-            rtl_versions = self._extract_rtl_versions(sheets_data, data_analysis)
+            rtl_versions = self._extract_rtl_versions(first_sheet_data, data_analysis, rtl_values)
             
             # Generate RTL view layout
-            rtl_layout = self._generate_rtl_layout(sheets_data, data_analysis, rtl_versions)
+            rtl_layout = self._generate_rtl_layout(first_sheet_data, data_analysis, rtl_versions, rtl_values)
             
             return rtl_layout
             
@@ -132,48 +140,47 @@ class RTLViewAnalyzer:
             logger.error(f"Error in RTL pattern analysis: {e}")
             raise ValueError(f"Failed to analyze RTL patterns: {str(e)}")
     
-    def _analyze_data_structure(self, sheets_data: Dict[str, Any], rtl_column: str) -> Dict[str, Any]:
+    def _analyze_data_structure(self, first_sheet_data: Any, rtl_column: str) -> Dict[str, Any]:
         """Analyze the basic data structure to identify runs, stages, and RTL versions"""
         
-        # Get first sheet for analysis
-        first_sheet_data = list(sheets_data.values())[0]
-        
         # Handle both pandas DataFrame and fallback dict format
-        if HAS_PANDAS and hasattr(first_sheet_data, 'columns'):
+        is_frame = HAS_PANDAS and hasattr(first_sheet_data, 'columns')
+        if is_frame:
             columns = first_sheet_data.columns.tolist()
-            all_data = first_sheet_data.to_dict('records')
         else:
             # Fallback: get columns from first row
             if first_sheet_data and len(first_sheet_data) > 0:
                 columns = list(first_sheet_data[0].keys())
-                all_data = first_sheet_data
             else:
                 raise ValueError("No data found in the file")
         
         logger.info(f"Analyzing RTL data structure with columns: {columns}")
         
-        # Extract username from data
+        # Extract username from the first row whose run-like values look like s_girishR1
         username = "Unknown User"
-        if all_data and len(all_data) > 0:
-            # Try to extract username from any run name in the data
-            for row in all_data:
-                # Look for run_name column or similar
-                for col in columns:
-                    if 'run' in col.lower() and col != rtl_column:
-                        row_value = str(row.get(col, ''))
-                        if '_' in row_value and 'R' in row_value:  # Look for pattern like s_girishR1
-                            parts = row_value.split('_')
-                            if len(parts) >= 2:
-                                username_part = parts[1]
-                                # Extract alphabetic part before 'R' (e.g., girishR1 -> girish)
-                                if 'R' in username_part:
-                                    username = username_part.split('R')[0]  # Take part before 'R'
-                                else:
-                                    username = ''.join([c for c in username_part if c.isalpha()])
-                                if username and len(username) > 1:
-                                    break
-                if username != "Unknown User":
-                    break
+        run_like_columns = [col for col in columns if 'run' in col.lower() and col != rtl_column]
+        if run_like_columns:
+            if is_frame:
+                # Find that row with vectorized substring checks instead of walking every row
+                run_values = first_sheet_data[run_like_columns].astype(str)
+                candidate = None
+                for col in run_like_columns:
+                    values = run_values[col]
+                    # Cheap probe first: a column without any '_' cannot hold the pattern
+                    col_hits = values.str.contains('_', regex=False)
+                    if not col_hits.any():
+                        continue
+                    col_hits &= values.str.contains('R', regex=False)
+                    candidate = col_hits if candidate is None else candidate | col_hits
+                if candidate is not None and candidate.any():
+                    row_values = run_values.iloc[int(candidate.to_numpy().argmax())].tolist()
+                    username = self._username_from_run_values(row_values)
+            else:
+                for row in first_sheet_data:
+                    found = self._username_from_run_values([str(row.get(col, '')) for col in run_like_columns])
+                    if found is not None:
+                        username = found
+                        break
         
         # Identify run column and stage columns
         run_column = None
@@ -200,21 +207,39 @@ class RTLViewAnalyzer:
             'column_order': {stage: idx for idx, stage in enumerate(stage_columns)}
         }
     
-    def _extract_rtl_versions(self, sheets_data: Dict[str, Any], data_analysis: Dict[str, Any]) -> List[str]:
+    def _username_from_run_values(self, row_values: List[str]) -> Optional[str]:
+        """Username from one row's run-like values, or None when none look like s_girishR1"""
+        username = None
+        for row_value in row_values:
+            if '_' in row_value and 'R' in row_value:  # Look for pattern like s_girishR1
+                username_part = row_value.split('_')[1]
+                # Extract alphabetic part before 'R' (e.g., girishR1 -> girish)
+                if 'R' in username_part:
+                    username = username_part.split('R')[0]  # Take part before 'R'
+                else:
+                    username = ''.join([c for c in username_part if c.isalpha()])
+                if username and len(username) > 1:
+                    break
+        return username
+    
+    def _valid_rtl_values(self, df: Any, rtl_column: str) -> Any:
+        """Stripped RTL versions of the rows that have one (not empty, not 'nan'), indexed like df"""
+        rtl_values = df[rtl_column].astype(str).str.strip()
+        return rtl_values[(rtl_values != '') & (rtl_values.str.lower() != 'nan')]
+    
+    def _extract_rtl_versions(self, first_sheet_data: Any, data_analysis: Dict[str, Any], rtl_values: Any = None) -> List[str]:
         """Extract unique RTL versions from the data"""
         
-        first_sheet_data = list(sheets_data.values())[0]
         rtl_column = data_analysis['rtl_column']
         
         rtl_versions = set()
         
         # Handle both pandas DataFrame and fallback dict format
         if HAS_PANDAS and hasattr(first_sheet_data, 'iterrows'):
-            # Pandas DataFrame
-            for _, row in first_sheet_data.iterrows():
-                rtl_value = str(row[rtl_column]).strip()
-                if rtl_value and rtl_value.lower() != 'nan':
-                    rtl_versions.add(rtl_value)
+            # Pandas DataFrame: strip and filter the whole column at once
+            if rtl_values is None:
+                rtl_values = self._valid_rtl_values(first_sheet_data, rtl_column)
+            rtl_versions = rtl_values.unique().tolist()
         else:
             # Fallback dict format
             for row in first_sheet_data:
@@ -222,23 +247,20 @@ class RTLViewAnalyzer:
                 if rtl_value:
                     rtl_versions.add(rtl_value)
         
-        # Sort RTL versions naturally (RTL_1, RTL_2, etc.)
+        # Sort RTL versions naturally (RTL_1, RTL_2, etc.) by their first number, 0 when there is none
         def sort_rtl_version(version):
-            # Extract number from RTL version
-            numbers = re.findall(r'\d+', version)
-            if numbers:
-                return int(numbers[0])
-            return 0
+            match = VERSION_NUMBER_PATTERN.search(version)
+            return int(match.group()) if match else 0
         
-        sorted_versions = sorted(list(rtl_versions), key=sort_rtl_version)
+        sorted_versions = sorted(rtl_versions, key=sort_rtl_version)
         logger.info(f"Found RTL versions: {sorted_versions}")
         
         return sorted_versions
     
-    def _generate_rtl_layout(self, sheets_data: Dict[str, Any], data_analysis: Dict[str, Any], rtl_versions: List[str]) -> Dict[str, Any]:
+    def _generate_rtl_layout(self, first_sheet_data: Any, data_analysis: Dict[str, Any], rtl_versions: List[str],
+                             rtl_values: Any = None) -> Dict[str, Any]:
         """Generate RTL view layout with version-specific branching"""
         
-        first_sheet_data = list(sheets_data.values())[0]
         rtl_column = data_analysis['rtl_column']
         run_column = data_analysis['run_column']
         stage_columns = data_analysis['stage_columns']
@@ -249,17 +271,15 @@ class RTLViewAnalyzer:
         
         # Handle both pandas DataFrame and fallback dict format
         if HAS_PANDAS and hasattr(first_sheet_data, 'iterrows'):
-            # Pandas DataFrame
-            for _, row in first_sheet_data.iterrows():
-                rtl_value = str(row[rtl_column]).strip()
-                if rtl_value and rtl_value.lower() != 'nan':
-                    if rtl_value not in version_data:
-                        version_data[rtl_value] = []
-                    
-                    row_data = {}
-                    for col in [run_column] + stage_columns:
-                        row_data[col] = str(row[col]) if pd.notna(row[col]) else ''
-                    version_data[rtl_value].append(row_data)
+            # Pandas DataFrame: one groupby on the stripped version instead of iterrows
+            columns = [run_column] + stage_columns
+            if rtl_values is None:
+                rtl_values = self._valid_rtl_values(first_sheet_data, rtl_column)
+            # Blank out missing cells and stringify the whole block in one pass
+            cells = first_sheet_data.loc[rtl_values.index, columns]
+            cells = cells.astype(object).where(cells.notna(), '').astype(str)
+            for rtl_value, group in cells.groupby(rtl_values, sort=False):
+                version_data[rtl_value] = group.to_dict('records')
         else:
             # Fallback dict format
             for row in first_sheet_data:
@@ -273,14 +293,11 @@ class RTLViewAnalyzer:
                         row_data[col] = str(row.get(col, '')) if row.get(col) else ''
                     version_data[rtl_value].append(row_data)
         
-        # Generate branch analysis for each RTL version
+        # Generate branch analysis for each RTL version; the branch analyzer is stateless, so one serves all versions
         version_analyses = {}
+        analyzer = SimpleBranchAnalyzer()
         for version in rtl_versions:
             if version in version_data:
-                # Import branch analyzer for individual version analysis
-                from simple_branch_analyzer import SimpleBranchAnalyzer
-                analyzer = SimpleBranchAnalyzer()
-                
                 # Convert version data to the format expected by SimpleBranchAnalyzer
                 version_rows = version_data[version]
                 
@@ -326,7 +343,8 @@ if __name__ == "__main__":
     
     try:
         result = analyze_rtl_view(file_path)
-        print(json.dumps(result))
+        # Compact separators; ASCII escaping is kept because the Node caller decodes stdout per chunk
+        print(json.dumps(result, separators=(',', ':')))
     except Exception as e:
         print(json.dumps({"error": str(e)}))
         sys.exit(1)
\ No newline at end of file
@@ -6,49 +6,222 @@ Works without pandas dependency issues
 
 import json
 import csv
+import re
 import sys
 import os
+import atexit
+import hashlib
+import functools
+import itertools
+import threading
 import requests
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Any, Optional, Tuple
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 # Ollama configuration
 OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL = "mistral"  # Using Mistral model specifically
 
-def read_csv_data(file_path: str) -> List[Dict[str, Any]]:
-    """Read CSV data without pandas"""
-    data = []
+# Ask the model even when every column role is obvious from the header (for debugging the AI path)
+FORCE_AI = os.environ.get("RUN_STATUS_FORCE_AI") == "1"
+
+# Rows and per-cell characters of the sample shown to the model
+PROMPT_SAMPLE_ROWS = 20
+PROMPT_CELL_CHARS = 40
+
+# Read CSVs in 1 MiB blocks instead of the default 8 KiB buffer
+CSV_BUFFER_SIZE = 1 << 20
+
+# Ollama serves at most OLLAMA_NUM_PARALLEL requests per model at once; extra workers only queue
+MAX_PARALLEL_REQUESTS = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+
+# One pooled keep-alive session for every model call instead of a new connection per request
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_SESSION.headers.update({"Connection": "keep-alive"})
+atexit.register(_SESSION.close)
+
+# Identical prompts get identical answers, so parsed analyses are reused across CLI invocations
+# (every RUN_STATUS cache lives under ~/.cache/runstatus)
+ANALYSIS_CACHE_DIR = os.path.expanduser("~/.cache/runstatus/analysis")
+_ANALYSIS_CACHE: Dict[str, bytes] = {}
+
+def dumps_json(obj: Any) -> bytes:
+    """Compact UTF-8 JSON for request bodies, cache files and CLI output, using orjson when installed"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def loads_json(data: Any) -> Any:
+    """Parse JSON text or bytes with orjson when installed; its errors subclass json.JSONDecodeError"""
+    return orjson.loads(data) if HAS_ORJSON else json.loads(data)
+
+# Header keywords that identify each column role
+COLUMN_KEYWORDS = {
+    "user": ['user', 'owner', 'designer', 'engineer'],
+    "run": ['run', 'flow', 'job', 'batch', 'iteration'],
+    "stage": ['stage', 'step', 'phase', 'task', 'tool', 'process'],
+    "status": ['status', 'state', 'result', 'outcome']
+}
+
+def detect_columns(columns: List[str]) -> Dict[str, Optional[str]]:
+    """First column whose name contains one of each role's keywords, or None for that role"""
+    return {
+        role: next((col for col in columns if any(keyword in col.lower() for keyword in keywords)), None)
+        for role, keywords in COLUMN_KEYWORDS.items()
+    }
+
+@dataclass(slots=True)
+class StageInfo:
+    """One grouped row in the fallback analysis"""
+    stage: str
+    status: str
+
+# Canonical EDA stage order used by the fallback analysis
+STAGE_SEQUENCE = ("synth", "floorplan", "place", "cts", "route", "drc", "verification", "signoff")
+
+@functools.lru_cache(maxsize=1024)
+def stage_rank(stage: str) -> int:
+    """Position of a stage name in STAGE_SEQUENCE; stage names repeat across runs, so results are cached"""
+    stage_name = stage.lower()
+    for i, known_stage in enumerate(STAGE_SEQUENCE):
+        if known_stage in stage_name:
+            return i
+    return len(STAGE_SEQUENCE)  # Unknown stages go to end
+
+# Status keywords per class, one alternation each, checked in priority order
+STATUS_PATTERNS = (
+    ("completed", re.compile(r'complete|done|success|pass')),
+    ("failed", re.compile(r'fail|error|abort')),
+    ("running", re.compile(r'run|active|progress'))
+)
+
+@functools.lru_cache(maxsize=1024)
+def classify_status(status: str) -> str:
+    """Map a raw status value to completed/failed/running/pending"""
+    status = status.lower()
+    for node_status, pattern in STATUS_PATTERNS:
+        if pattern.search(status):
+            return node_status
+    return "pending"
+
+# Base node color per stage keyword; the first keyword found in the stage name wins
+STAGE_COLORS = {
+    "synth": "#007bff",         # Blue
+    "floorplan": "#28a745",     # Green
+    "place": "#ffc107",         # Yellow
+    "cts": "#6f42c1",           # Purple
+    "route": "#fd7e14",         # Orange
+    "drc": "#dc3545",           # Red
+    "verify": "#20c997",        # Teal
+    "verification": "#20c997",  # Teal
+    "signoff": "#6c757d"        # Gray
+}
+
+@functools.lru_cache(maxsize=1024)
+def get_stage_color(stage: str) -> str:
+    """Base color for a stage name, lowercased here so each distinct name is normalized once"""
+    stage_name = stage.lower()
+    for keyword, color in STAGE_COLORS.items():
+        if keyword in stage_name:
+            return color
+    return "#17a2b8"  # Info blue
+
+# (fill, stroke, text color, opacity) per node status; None stands for the stage's base color
+STATUS_STYLES = {
+    "completed": (None, None, "#FFFFFF", 1.0),
+    "failed": ("#dc3545", "#c82333", "#FFFFFF", 1.0),
+    "running": ("#ffc107", "#e0a800", "#212529", 1.0),
+    "pending": ("#f8f9fa", None, None, 0.7)
+}
+
+# Node style keys in output order; the None entries are filled in per node
+NODE_STYLE_TEMPLATE = {
+    "width": None,
+    "height": None,
+    "fill": None,
+    "stroke": None,
+    "strokeWidth": 2,
+    "cornerRadius": 8,
+    "fontSize": 12,
+    "textColor": None,
+    "fontWeight": "600",
+    "opacity": None,
+    "shadow": True,
+    "shadowColor": "rgba(0,0,0,0.2)",
+    "shadowBlur": 4,
+    "shadowOffsetX": 1,
+    "shadowOffsetY": 1
+}
+
+def _analysis_cache_key(prompt: str) -> str:
+    """Hash the whole prompt; the model's nodes depend on the sample rows, not just the columns"""
+    return hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+
+def _is_complete_analysis(analysis: Any) -> bool:
+    """Whether an analysis has every field generate_flow_chart_layout reads, so it is safe to cache"""
+    try:
+        return (isinstance(analysis["analysis"]["data_type"], str)
+                and isinstance(analysis["flow_structure"]["nodes"], list)
+                and isinstance(analysis["flow_structure"]["connections"], list))
+    except (KeyError, TypeError):
+        return False
+
+def _load_cached_analysis(key: str) -> Optional[Dict[str, Any]]:
+    """Return a fresh copy of a cached analysis, checking memory before disk; incomplete entries are ignored"""
+    data = _ANALYSIS_CACHE.get(key)
+    if data is None:
+        try:
+            with open(os.path.join(ANALYSIS_CACHE_DIR, f"{key}.json"), 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+    try:
+        analysis = loads_json(data)
+    except ValueError:
+        return None
+    if not _is_complete_analysis(analysis):
+        return None
+    _ANALYSIS_CACHE[key] = data
+    return analysis
+
+def _store_cached_analysis(key: str, analysis: Dict[str, Any]) -> None:
+    """Remember a complete analysis in memory and on disk; a failed write only costs a future model call"""
+    if not _is_complete_analysis(analysis):
+        return
+    data = dumps_json(analysis)
+    _ANALYSIS_CACHE[key] = data
+    try:
+        os.makedirs(ANALYSIS_CACHE_DIR, exist_ok=True)
+        path = os.path.join(ANALYSIS_CACHE_DIR, f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not write analysis cache: {e}", file=sys.stderr)
+
+def read_csv_data(file_path: str) -> Tuple[List[str], List[List[str]]]:
+    """Read the CSV header and its rows as positional lists, without pandas or per-row dicts"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                data.append(dict(row))
-        return data
+        with open(file_path, 'r', encoding='utf-8', newline='', buffering=CSV_BUFFER_SIZE) as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            return header, [row for row in reader if row]
     except Exception as e:
         raise ValueError(f"Error reading CSV file: {str(e)}")
 
-def analyze_data_structure(data: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Analyze data structure using AI with focus on proper flow chart structure"""
-    if not data:
-        raise ValueError("No data to analyze")
-    
-    # Get sample data for analysis
-    sample_size = min(20, len(data))
-    sample_data = data[:sample_size]
-    
-    # Get column information
-    columns = list(data[0].keys()) if data else []
-    
-    # Create enhanced AI prompt for proper flow chart analysis
-    prompt = f"""
-    You are an expert in EDA (Electronic Design Automation) flow analysis. Analyze this data to create a proper flow chart structure.
-    
-    COLUMNS: {columns}
-    
-    SAMPLE DATA:
-    {json.dumps(sample_data, indent=2)}
-    
-    TOTAL ROWS: {len(data)}
+# Fixed part of the analysis prompt: instructions and response schema, ahead of the per-file data
+PROMPT_HEAD = """
+    You are an expert in EDA (Electronic Design Automation) flow analysis. Analyze the data at the end of this prompt to create a proper flow chart structure.
     
     IMPORTANT FLOW CHART RULES:
     1. Identify USER/RUN/STAGE structure (typical EDA flow has users running multiple runs with stages like synth, floorplan, place, cts, route, drc)
@@ -68,8 +241,8 @@ def analyze_data_structure(data: List[Dict[str, Any]]) -> Dict[str, Any]:
     - The sequence of runs for each user
     
     Respond with JSON in this exact format:
-    {{
-        "analysis": {{
+    {
+        "analysis": {
             "data_type": "eda_flow",
             "user_column": "column_name_for_user_identification",
             "run_column": "column_name_for_run_identification", 
@@ -77,12 +250,12 @@ def analyze_data_structure(data: List[Dict[str, Any]]) -> Dict[str, Any]:
             "status_column": "column_name_for_status",
             "stage_sequence": ["synth", "floorplan", "place", "cts", "route", "drc"],
             "users_found": ["list_of_unique_users"],
-            "runs_per_user": {{"user1": ["run1", "run2"], "user2": ["run1", "run2"]}},
+            "runs_per_user": {"user1": ["run1", "run2"], "user2": ["run1", "run2"]},
             "stages_found": ["list_of_unique_stages"]
-        }},
-        "flow_structure": {{
+        },
+        "flow_structure": {
             "nodes": [
-                {{
+                {
                     "id": "user_run_stage_unique_id",
                     "label": "stage_name",
                     "type": "stage_type",
@@ -92,44 +265,139 @@ def analyze_data_structure(data: List[Dict[str, Any]]) -> Dict[str, Any]:
                     "stage": "stage_name",
                     "run_order": 1,
                     "stage_order": 1
-                }}
+                }
             ],
             "connections": [
-                {{
+                {
                     "from": "source_node_id",
                     "to": "target_node_id",
                     "type": "within_run|between_runs",
                     "connection_category": "stage_sequence|run_sequence"
-                }}
+                }
             ]
-        }}
-    }}
+        }
+    }
+    
+"""
+
+def analyze_data_structure(header: List[str], rows: List[List[str]]) -> Dict[str, Any]:
+    """Analyze data structure using AI with focus on proper flow chart structure"""
+    if not rows:
+        raise ValueError("No data to analyze")
+    
+    # Only the prompt sample needs rows keyed by column name; long cells are cut to save prompt tokens
+    sample_data = [
+        dict(zip(header, (value[:PROMPT_CELL_CHARS] for value in row)))
+        for row in rows[:PROMPT_SAMPLE_ROWS]
+    ]
+    
+    # Get column information (a repeated header name counts once, as in a dict)
+    columns = list(dict.fromkeys(header))
+    
+    # When the header names every role unambiguously the fallback builds the same structure without a model round trip
+    detected = detect_columns(columns)
+    if not FORCE_AI and None not in detected.values() and len(set(detected.values())) == len(detected):
+        print("All columns identified from the header, skipping AI analysis...", file=sys.stderr)
+        return create_intelligent_fallback_analysis(rows, columns, header)
+    
+    # Only the data section is rendered per call
+    prompt = PROMPT_HEAD + f"""    COLUMNS: {columns}
+    
+    SAMPLE DATA:
+    {json.dumps(sample_data, separators=(',', ':'))}
+    
+    TOTAL ROWS: {len(rows)}
     """
     
+    cache_key = _analysis_cache_key(prompt)
+    cached = _load_cached_analysis(cache_key)
+    if cached is not None:
+        print("Using cached AI analysis for this data sample", file=sys.stderr)
+        return cached
+    
     try:
         print("Attempting AI analysis with Mistral model...", file=sys.stderr)
-        response = requests.post(OLLAMA_URL, json={
+        response = _SESSION.post(OLLAMA_URL, data=dumps_json({
             "model": MODEL,
             "prompt": prompt,
-            "stream": False
-        }, timeout=30)  # Reduced timeout
+            "stream": True
+        }), headers={"Content-Type": "application/json"}, stream=True, timeout=30)  # Reduced timeout
         
-        if response.status_code == 200:
-            ai_response = response.json().get("response", "")
-            print("AI analysis successful, parsing response...", file=sys.stderr)
-            return parse_ai_response(ai_response)
-        else:
-            print(f"AI request failed with status {response.status_code}, using fallback...", file=sys.stderr)
-            return create_intelligent_fallback_analysis(data, columns)
+        with response:
+            if response.status_code == 200:
+                print("AI analysis streaming, parsing response as it arrives...", file=sys.stderr)
+                analysis = read_streamed_analysis(response)
+                if not _is_complete_analysis(analysis):
+                    print("AI analysis is missing flow fields, using fallback...", file=sys.stderr)
+                    return create_intelligent_fallback_analysis(rows, columns, header)
+                _store_cached_analysis(cache_key, analysis)
+                return analysis
+            else:
+                print(f"AI request failed with status {response.status_code}, using fallback...", file=sys.stderr)
+                return create_intelligent_fallback_analysis(rows, columns, header)
     except Exception as e:
         print(f"AI analysis failed: {e}, using intelligent fallback...", file=sys.stderr)
-        return create_intelligent_fallback_analysis(data, columns)
+        return create_intelligent_fallback_analysis(rows, columns, header)
+
+def is_flow_analysis(analysis: Any) -> bool:
+    """Whether a parsed model answer has the sections generate_flow_chart_layout reads"""
+    return isinstance(analysis, dict) and "analysis" in analysis and "flow_structure" in analysis
+
+def read_streamed_analysis(response) -> Dict[str, Any]:
+    """Collect streamed Ollama tokens and return as soon as a complete top-level flow analysis parses.
+    
+    Anything the model writes after the object is never generated: closing the
+    response early drops the connection and Ollama stops decoding.
+    """
+    text = ""
+    scanned = 0
+    depth = 0
+    start = 0
+    in_string = escaped = False
+    for line in response.iter_lines():
+        if not line:
+            continue
+        chunk = loads_json(line)
+        text += chunk.get("response", "")
+        for i in range(scanned, len(text)):
+            char = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                # Quotes in prose around the JSON do not open strings
+                in_string = depth > 0
+            elif char == '{':
+                if depth == 0:
+                    start = i
+                depth += 1
+            elif char == '}' and depth:
+                depth -= 1
+                if depth == 0:
+                    try:
+                        analysis = loads_json(text[start:i + 1])
+                    except ValueError:
+                        continue  # Braces in prose; keep reading
+                    if is_flow_analysis(analysis):
+                        return analysis
+                    # An example object ahead of the answer; keep reading
+        scanned = len(text)
+        if chunk.get("done"):
+            break
+    analysis = parse_ai_response(text)
+    if not is_flow_analysis(analysis):
+        raise ValueError("AI response has no flow analysis")
+    return analysis
 
 def parse_ai_response(response: str) -> Dict[str, Any]:
     """Parse AI response and extract JSON"""
     try:
         # Try direct JSON parsing
-        return json.loads(response)
+        return loads_json(response)
     except:
         # Try to extract JSON from response
         try:
@@ -143,46 +411,45 @@ def parse_ai_response(response: str) -> Dict[str, Any]:
             else:
                 raise ValueError("No JSON found in response")
             
-            return json.loads(json_part)
+            return loads_json(json_part)
         except:
             raise ValueError("Could not parse AI response")
 
-def create_intelligent_fallback_analysis(data: List[Dict[str, Any]], columns: List[str]) -> Dict[str, Any]:
+def create_intelligent_fallback_analysis(rows: List[List[str]], columns: List[str],
+                                        header: Optional[List[str]] = None) -> Dict[str, Any]:
     """Create intelligent fallback analysis with proper EDA flow structure"""
     
     # Intelligent column detection
-    user_cols = [col for col in columns if any(keyword in col.lower() for keyword in ['user', 'owner', 'designer', 'engineer'])]
-    run_cols = [col for col in columns if any(keyword in col.lower() for keyword in ['run', 'flow', 'job', 'batch', 'iteration'])]
-    stage_cols = [col for col in columns if any(keyword in col.lower() for keyword in ['stage', 'step', 'phase', 'task', 'tool', 'process'])]
-    status_cols = [col for col in columns if any(keyword in col.lower() for keyword in ['status', 'state', 'result', 'outcome'])]
+    detected = detect_columns(columns)
     
     # Use first match or fallback
-    user_col = user_cols[0] if user_cols else columns[0] if columns else "user"
-    run_col = run_cols[0] if run_cols else columns[1] if len(columns) > 1 else "run"
-    stage_col = stage_cols[0] if stage_cols else columns[2] if len(columns) > 2 else "stage"
-    status_col = status_cols[0] if status_cols else columns[3] if len(columns) > 3 else "status"
+    user_col = detected["user"] or (columns[0] if columns else "user")
+    run_col = detected["run"] or (columns[1] if len(columns) > 1 else "run")
+    stage_col = detected["stage"] or (columns[2] if len(columns) > 2 else "stage")
+    status_col = detected["status"] or (columns[3] if len(columns) > 3 else "status")
     
     # Analyze data structure
     users = {}
-    stage_sequence = ["synth", "floorplan", "place", "cts", "route", "drc", "verification", "signoff"]
+    stages_found = set()
+    
+    # Resolve each column to a row offset once; a repeated header name reads its last occurrence
+    offsets = {name: idx for idx, name in enumerate(header if header is not None else columns)}
+    user_at, run_at, stage_at, status_at = (offsets.get(col) for col in (user_col, run_col, stage_col, status_col))
+    
+    def cell(row, idx, default):
+        if idx is None:
+            return default
+        return row[idx] if idx < len(row) else str(None)
     
     # Group data by user and run
-    for row in data:
-        user = str(row.get(user_col, "default_user"))
-        run = str(row.get(run_col, "default_run"))
-        stage = str(row.get(stage_col, "default_stage"))
-        status = str(row.get(status_col, "unknown"))
+    for row in rows:
+        user = cell(row, user_at, "default_user")
+        run = cell(row, run_at, "default_run")
+        stage = cell(row, stage_at, "default_stage")
+        status = cell(row, status_at, "unknown")
         
-        if user not in users:
-            users[user] = {}
-        if run not in users[user]:
-            users[user][run] = []
-        
-        users[user][run].append({
-            "stage": stage,
-            "status": status,
-            "row_data": row
-        })
+        users.setdefault(user, {}).setdefault(run, []).append(StageInfo(stage, status))
+        stages_found.add(stage)
     
     # Create nodes and connections
     nodes = []
@@ -190,44 +457,33 @@ def create_intelligent_fallback_analysis(data: List[Dict[str, Any]], columns: Li
     
     for user, runs in users.items():
         sorted_runs = sorted(runs.keys())  # Sort runs
+        prev_run_nodes = []
         
         for run_idx, run in enumerate(sorted_runs):
             stages = runs[run]
             
-            # Sort stages by known sequence or alphabetically
-            def stage_sort_key(stage_info):
-                stage_name = stage_info["stage"].lower()
-                for i, known_stage in enumerate(stage_sequence):
-                    if known_stage in stage_name:
-                        return i
-                return 999  # Unknown stages go to end
-            
-            sorted_stages = sorted(stages, key=stage_sort_key)
+            # Bucket stages by known sequence (file order within a rank); there are only nine ranks
+            buckets = [[] for _ in range(len(STAGE_SEQUENCE) + 1)]
+            for stage_info in stages:
+                buckets[stage_rank(stage_info.stage)].append(stage_info)
+            sorted_stages = list(itertools.chain.from_iterable(buckets))
             
             # Create nodes for this run
             run_nodes = []
             for stage_idx, stage_info in enumerate(sorted_stages):
-                node_id = f"{user}_{run}_{stage_info['stage']}_{stage_idx}"
+                node_id = f"{user}_{run}_{stage_info.stage}_{stage_idx}"
                 
                 # Determine status color
-                status = stage_info["status"].lower()
-                if any(word in status for word in ['complete', 'done', 'success', 'pass']):
-                    node_status = "completed"
-                elif any(word in status for word in ['fail', 'error', 'abort']):
-                    node_status = "failed"
-                elif any(word in status for word in ['run', 'active', 'progress']):
-                    node_status = "running"
-                else:
-                    node_status = "pending"
+                node_status = classify_status(stage_info.status)
                 
                 node = {
                     "id": node_id,
-                    "label": stage_info["stage"],
+                    "label": stage_info.stage,
                     "type": "stage",
                     "status": node_status,
                     "user": user,
                     "run": run,
-                    "stage": stage_info["stage"],
+                    "stage": stage_info.stage,
                     "run_order": run_idx,
                     "stage_order": stage_idx
                 }
@@ -244,20 +500,16 @@ def create_intelligent_fallback_analysis(data: List[Dict[str, Any]], columns: Li
                         "connection_category": "stage_sequence"
                     })
             
-            # Connect runs (last stage of prev run to first stage of current run)
-            if run_idx > 0 and run_nodes:
-                prev_run = sorted_runs[run_idx - 1]
-                prev_run_stages = [n for n in nodes if n["user"] == user and n["run"] == prev_run]
-                if prev_run_stages:
-                    last_prev_stage = max(prev_run_stages, key=lambda x: x["stage_order"])
-                    first_current_stage = min(run_nodes, key=lambda x: x["stage_order"])
-                    
-                    connections.append({
-                        "from": last_prev_stage["id"],
-                        "to": first_current_stage["id"],
-                        "type": "between_runs",
-                        "connection_category": "run_sequence"
-                    })
+            # Connect runs (last stage of prev run to first stage of current run);
+            # run_nodes is already in stage_order, so the ends are the list ends
+            if prev_run_nodes and run_nodes:
+                connections.append({
+                    "from": prev_run_nodes[-1]["id"],
+                    "to": run_nodes[0]["id"],
+                    "type": "between_runs",
+                    "connection_category": "run_sequence"
+                })
+            prev_run_nodes = run_nodes
     
     return {
         "analysis": {
@@ -266,10 +518,10 @@ def create_intelligent_fallback_analysis(data: List[Dict[str, Any]], columns: Li
             "run_column": run_col,
             "stage_column": stage_col,
             "status_column": status_col,
-            "stage_sequence": stage_sequence,
+            "stage_sequence": list(STAGE_SEQUENCE),
             "users_found": list(users.keys()),
             "runs_per_user": {user: list(runs.keys()) for user, runs in users.items()},
-            "stages_found": list(set([stage["stage"] for user_runs in users.values() for run_stages in user_runs.values() for stage in run_stages]))
+            "stages_found": list(stages_found)
         },
         "flow_structure": {
             "nodes": nodes,
@@ -308,8 +560,15 @@ def generate_flow_chart_layout(analysis: Dict[str, Any]) -> Dict[str, Any]:
         
         user_runs[user][run].append(node)
     
-    # Position nodes
+    # Position nodes, tracking the canvas extent as we go
     current_y = margin_y
+    max_x = max_y = 0
+    
+    # Nodes with the same colors share one style dict; there are only a few dozen combinations
+    style_catalog = {}
+    
+    # Status counts for the metadata, gathered in the same pass
+    status_counts = dict.fromkeys(STATUS_STYLES, 0)
     
     for user_idx, (user, runs) in enumerate(user_runs.items()):
         user_start_y = current_y
@@ -329,52 +588,30 @@ def generate_flow_chart_layout(analysis: Dict[str, Any]) -> Dict[str, Any]:
             for stage_idx, node in enumerate(run_nodes):
                 x = margin_x + (stage_idx * stage_spacing_x)
                 y = run_y
+                max_x = max(max_x, x + node_width)
+                max_y = max(max_y, y + node_height)
                 
                 # Determine colors based on stage type and status
-                stage_name = node.get("stage", "").lower()
                 status = node.get("status", "pending")
                 
                 # Stage-specific colors
-                if "synth" in stage_name:
-                    base_color = "#007bff"  # Blue
-                elif "floorplan" in stage_name:
-                    base_color = "#28a745"  # Green
-                elif "place" in stage_name:
-                    base_color = "#ffc107"  # Yellow
-                elif "cts" in stage_name:
-                    base_color = "#6f42c1"  # Purple
-                elif "route" in stage_name:
-                    base_color = "#fd7e14"  # Orange
-                elif "drc" in stage_name:
-                    base_color = "#dc3545"  # Red
-                elif "verify" in stage_name or "verification" in stage_name:
-                    base_color = "#20c997"  # Teal
-                elif "signoff" in stage_name:
-                    base_color = "#6c757d"  # Gray
-                else:
-                    base_color = "#17a2b8"  # Info blue
+                base_color = get_stage_color(node.get("stage", ""))
                 
-                # Status-based modifications
-                if status == "completed":
-                    fill_color = base_color
-                    stroke_color = base_color
-                    text_color = "#FFFFFF"
-                    opacity = 1.0
-                elif status == "failed":
-                    fill_color = "#dc3545"
-                    stroke_color = "#c82333"
-                    text_color = "#FFFFFF"
-                    opacity = 1.0
-                elif status == "running":
-                    fill_color = "#ffc107"
-                    stroke_color = "#e0a800"
-                    text_color = "#212529"
-                    opacity = 1.0
-                else:  # pending
-                    fill_color = "#f8f9fa"
-                    stroke_color = base_color
-                    text_color = base_color
-                    opacity = 0.7
+                # Status-based modifications (unknown statuses render and count as pending)
+                status_counts[status if status in status_counts else "pending"] += 1
+                fill_color, stroke_color, text_color, opacity = STATUS_STYLES.get(status, STATUS_STYLES["pending"])
+                style_key = (base_color, fill_color, stroke_color, text_color, opacity)
+                style = style_catalog.get(style_key)
+                if style is None:
+                    style = style_catalog[style_key] = dict(
+                        NODE_STYLE_TEMPLATE,
+                        width=node_width,
+                        height=node_height,
+                        fill=fill_color or base_color,
+                        stroke=stroke_color or base_color,
+                        textColor=text_color or base_color,
+                        opacity=opacity
+                    )
                 
                 # Update node with position and styling
                 node.update({
@@ -383,23 +620,7 @@ def generate_flow_chart_layout(analysis: Dict[str, Any]) -> Dict[str, Any]:
                     "user_idx": user_idx,
                     "run_idx": run_idx,
                     "stage_idx": stage_idx,
-                    "style": {
-                        "width": node_width,
-                        "height": node_height,
-                        "fill": fill_color,
-                        "stroke": stroke_color,
-                        "strokeWidth": 2,
-                        "cornerRadius": 8,
-                        "fontSize": 12,
-                        "textColor": text_color,
-                        "fontWeight": "600",
-                        "opacity": opacity,
-                        "shadow": True,
-                        "shadowColor": "rgba(0,0,0,0.2)",
-                        "shadowBlur": 4,
-                        "shadowOffsetX": 1,
-                        "shadowOffsetY": 1
-                    }
+                    "style": style
                 })
         
         # Update current_y for next user
@@ -407,11 +628,9 @@ def generate_flow_chart_layout(analysis: Dict[str, Any]) -> Dict[str, Any]:
     
     # Enhanced connections with proper styling
     formatted_connections = []
+    node_ids = {node["id"] for node in nodes}
     for conn in connections:
-        from_node = next((n for n in nodes if n["id"] == conn["from"]), None)
-        to_node = next((n for n in nodes if n["id"] == conn["to"]), None)
-        
-        if from_node and to_node:
+        if conn["from"] in node_ids and conn["to"] in node_ids:
             # Determine connection style and color
             conn_type = conn.get("type", "within_run")
             
@@ -443,10 +662,6 @@ def generate_flow_chart_layout(analysis: Dict[str, Any]) -> Dict[str, Any]:
                 }
             })
     
-    # Calculate layout dimensions
-    max_x = max([node["x"] + node["style"]["width"] for node in nodes]) if nodes else 1200
-    max_y = max([node["y"] + node["style"]["height"] for node in nodes]) if nodes else 800
-    
     return {
         "nodes": nodes,
         "connections": formatted_connections,
@@ -485,10 +700,10 @@ def generate_flow_chart_layout(analysis: Dict[str, Any]) -> Dict[str, Any]:
         },
         "metadata": {
             "total_steps": len(nodes),
-            "completed_steps": len([n for n in nodes if n["status"] == "completed"]),
-            "failed_steps": len([n for n in nodes if n["status"] == "failed"]),
-            "running_steps": len([n for n in nodes if n["status"] == "running"]),
-            "pending_steps": len([n for n in nodes if n["status"] not in ["completed", "failed", "running"]]),
+            "completed_steps": status_counts["completed"],
+            "failed_steps": status_counts["failed"],
+            "running_steps": status_counts["running"],
+            "pending_steps": status_counts["pending"],
             "analysis_type": analysis["analysis"]["data_type"],
             "users_count": len(user_runs),
             "total_runs": sum(len(runs) for runs in user_runs.values()),
@@ -527,10 +742,10 @@ def analyze_and_generate_layout(file_path: str) -> Dict[str, Any]:
     """Main function to analyze data and generate flow chart layout"""
     try:
         # Read data
-        data = read_csv_data(file_path)
+        header, rows = read_csv_data(file_path)
         
         # Analyze structure
-        analysis = analyze_data_structure(data)
+        analysis = analyze_data_structure(header, rows)
         
         # Generate layout
         layout = generate_flow_chart_layout(analysis)
@@ -540,16 +755,27 @@ def analyze_and_generate_layout(file_path: str) -> Dict[str, Any]:
     except Exception as e:
         raise ValueError(f"Failed to analyze and generate layout: {str(e)}")
 
+def analyze_and_generate_layout_many(file_paths: List[str]) -> List[Dict[str, Any]]:
+    """Analyze several CSV files with their model calls overlapping instead of running back to back"""
+    if not file_paths:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_REQUESTS, len(file_paths))) as pool:
+        return list(pool.map(analyze_and_generate_layout, file_paths))
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print(json.dumps({"error": "Usage: python simple_analyzer.py <csv_file_path>"}))
+    if len(sys.argv) < 2:
+        print(json.dumps({"error": "Usage: python simple_analyzer.py <csv_file_path> [<csv_file_path> ...]"}))
         sys.exit(1)
     
-    file_path = sys.argv[1]
+    file_paths = sys.argv[1:]
     
     try:
-        result = analyze_and_generate_layout(file_path)
-        print(json.dumps(result))
+        # A single file keeps the original object output; several files print a list of layouts
+        if len(file_paths) == 1:
+            result = analyze_and_generate_layout(file_paths[0])
+        else:
+            result = analyze_and_generate_layout_many(file_paths)
+        sys.stdout.buffer.write(dumps_json(result) + b"\n")
     except Exception as e:
         print(json.dumps({"error": str(e)}))
         sys.exit(1)
\ No newline at end of file
@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 
 import csv
+import io
 import logging
 import re
+import sys
 import json
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Union, BinaryIO, TextIO
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Set up logging (handlers are left to the application or the CLI below)
 logger = logging.getLogger(__name__)
 
+# Second '_'-separated part of a run name up to its first 'R', at least two characters (s_girishR1 -> girish)
+USERNAME_PATTERN = re.compile(r'^[^_]*_([^_R]{2,})R')
+
+# Read CSV files in 1 MiB blocks instead of the default 8 KiB buffer
+CSV_BUFFER_SIZE = 1 << 20
+
 class SimpleBranchAnalyzer:
     """
     Simple Branch Analyzer - implements EXACT user logic:
@@ -20,36 +27,41 @@ class SimpleBranchAnalyzer:
     5. Make it scrollable (no zoom buttons)
     """
     
-    def analyze_csv(self, file_path: str) -> Dict[str, Any]:
-        """Analyze CSV file with user's exact branching logic"""
+    def _open_csv(self, source: Union[str, BinaryIO]) -> TextIO:
+        """Open a CSV path, or wrap an in-memory binary upload, as UTF-8 text"""
+        if hasattr(source, 'read'):
+            return io.TextIOWrapper(source, encoding='utf-8', newline='')
+        return open(source, 'r', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE)
+    
+    def analyze_csv(self, file_path: Union[str, BinaryIO]) -> Dict[str, Any]:
+        """Analyze CSV file (path or binary file-like) with user's exact branching logic"""
         
         try:
-            # Read CSV file
-            all_data = []
-            with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
+            # Read CSV rows straight into per-run stage values, without keeping the rows
+            with self._open_csv(file_path) as csvfile:
                 reader = csv.DictReader(csvfile)
                 columns = reader.fieldnames
-                for row in reader:
-                    all_data.append(row)
+                if not columns:
+                    raise ValueError("CSV file is empty")
+                
+                # Get columns (first column is run name, rest are stages)
+                run_column = columns[0]
+                stage_columns = [sys.intern(stage) for stage in columns[1:]]
+                runs_data = self._extract_runs_data(reader, run_column, stage_columns)
             
-            logger.info(f"Loaded CSV with {len(all_data)} rows and {len(columns)} columns")
+            logger.info(f"Loaded CSV with {len(runs_data)} runs and {len(columns)} columns")
             
-            if not all_data:
+            if not runs_data:
                 raise ValueError("CSV file is empty")
             
-            # Get columns (first column is run name, rest are stages)
-            run_column = columns[0]
-            stage_columns = columns[1:]
-            
             logger.info(f"Run column: {run_column}")
             logger.info(f"Stage columns: {stage_columns}")
             
-            # Extract username from run names
-            run_names = [row[run_column] for row in all_data]
-            username = self._extract_username(run_names)
+            # Extract username from run names (first match in file order)
+            username = self._extract_username(list(runs_data))
             
             # Analyze branching patterns
-            branch_analysis = self._analyze_branching_patterns(all_data, run_column, stage_columns)
+            branch_analysis = self._analyze_runs(runs_data, stage_columns)
             
             # Generate visualization layout
             layout_data = self._generate_layout(branch_analysis, stage_columns, username)
@@ -64,120 +76,133 @@ class SimpleBranchAnalyzer:
         """Extract username from run names (e.g., s_girishR1 -> girish)"""
         
         for run_name in run_names:
-            run_str = str(run_name)
-            if '_' in run_str and 'R' in run_str:
-                parts = run_str.split('_')
-                if len(parts) >= 2:
-                    username_part = parts[1]
-                    if 'R' in username_part:
-                        username = username_part.split('R')[0]
-                        if username and len(username) > 1:
-                            return username
+            match = USERNAME_PATTERN.match(str(run_name))
+            if match:
+                return match.group(1)
         
         return "Unknown User"
     
+    def _extract_runs_data(self, rows: Iterable[Dict], run_column: str, stage_columns: List[str]) -> Dict[str, Dict[str, str]]:
+        """Stripped stage values per run in a single pass; a repeated run name keeps its first position and last values"""
+        runs_data = {}
+        for row in rows:
+            # Interned so every node and pattern of a run shares one name object
+            runs_data[sys.intern(str(row[run_column]))] = {stage: str(row.get(stage, '')).strip() for stage in stage_columns}
+        return runs_data
+    
     def _analyze_branching_patterns(self, all_data: List[Dict], run_column: str, stage_columns: List[str]) -> Dict[str, Any]:
         """Analyze branching patterns using user's exact logic"""
+        return self._analyze_runs(self._extract_runs_data(all_data, run_column, stage_columns), stage_columns)
+    
+    def _analyze_runs(self, runs_data: Dict[str, Dict[str, str]], stage_columns: List[str]) -> Dict[str, Any]:
+        """Classify each run as first, independent or branching from its stage values"""
         
-        runs_data = {}
         branch_patterns = {}
         
-        # Extract run data
-        for row in all_data:
-            run_name = str(row[run_column])
-            runs_data[run_name] = {}
-            for stage in stage_columns:
-                runs_data[run_name][stage] = str(row.get(stage, '')).strip()
-        
         # Sort runs (first run is index 0)
         sorted_runs = list(runs_data.keys())
-        logger.info(f"Processing runs in order: {sorted_runs}")
+        logger.debug("Processing runs in order: %s", sorted_runs)
+        
+        # Per-run and per-match messages are only formatted when debug logging is on
+        debug = logger.isEnabledFor(logging.DEBUG)
+        
+        # Position of each stage column; a repeated name keeps its first position, like list.index()
+        stage_to_idx = {}
+        for stage_index, stage in enumerate(stage_columns):
+            stage_to_idx.setdefault(stage, stage_index)
+        
+        # Earliest (run, stage, stage index) holding each non-empty value, filled in
+        # after each run so a run only ever matches values from the runs before it
+        value_sources = {}
         
         # Analyze each run using user's logic
         for i, current_run in enumerate(sorted_runs):
+            current_data = runs_data[current_run]
             
             if i == 0:
                 # First run: display all stages (starting run)
-                logger.info(f"{current_run}: First run - display all stages")
+                if debug:
+                    logger.debug("%s: First run - display all stages", current_run)
                 branch_patterns[current_run] = {
                     'type': 'first_run',
                     'display_all': True,
                     'copied_stages': {},
                     'new_stages': []
                 }
-                continue
-            
-            current_data = runs_data[current_run]
-            copied_stages = {}
-            
-            # Check if this run copies data from ANY previous run
-            for stage in stage_columns:
-                current_value = current_data[stage]
+            else:
+                copied_stages = {}
                 
-                if not current_value:  # Skip empty stages
-                    continue
+                # LAST copied stage (highest index), tracked as matches are found
+                last_copied_stage = None
+                last_copied_index = -1
                 
-                # Look for this exact value in previous runs
-                for prev_run in sorted_runs[:i]:
-                    prev_data = runs_data[prev_run]
-                    
-                    for prev_stage in stage_columns:
-                        prev_value = prev_data[prev_stage]
+                # Check if this run copies data from ANY previous run; one set test rules out runs sharing no value
+                if not value_sources.keys().isdisjoint(current_data.values()):
+                    for stage in stage_columns:
+                        current_value = current_data[stage]
+                        
+                        if not current_value:  # Skip empty stages
+                            continue
                         
-                        if prev_value and current_value == prev_value:
+                        # Look for this exact value in previous runs
+                        source = value_sources.get(current_value)
+                        if source is not None:
                             # Found exact match - this is copied data
-                            copied_stages[stage] = {
+                            prev_run, prev_stage, prev_stage_index = source
+                            stage_index = stage_to_idx[stage]
+                            copy_info = copied_stages[stage] = {
                                 'source_run': prev_run,
                                 'source_stage': prev_stage,
                                 'value': current_value,
-                                'stage_index': stage_columns.index(stage),
-                                'source_stage_index': stage_columns.index(prev_stage)
+                                'stage_index': stage_index,
+                                'source_stage_index': prev_stage_index
                             }
-                            logger.info(f"{current_run}.{stage} = '{current_value}' (copied from {prev_run}.{prev_stage})")
-                            break
+                            if stage_index > last_copied_index:
+                                last_copied_index = stage_index
+                                last_copied_stage = copy_info
+                            if debug:
+                                logger.debug("%s.%s = '%s' (copied from %s.%s)",
+                                             current_run, stage, current_value, prev_run, prev_stage)
+                
+                # Determine run type based on copied data
+                if not copied_stages:
+                    # No copied data: independent run - display all stages
+                    if debug:
+                        logger.debug("%s: Independent run - display all stages", current_run)
+                    branch_patterns[current_run] = {
+                        'type': 'independent_run',
+                        'display_all': True,
+                        'copied_stages': {},
+                        'new_stages': []
+                    }
+                else:
+                    # Has copied data: branching run
+                    if debug:
+                        logger.debug("%s: Branching run - copied %d stages", current_run, len(copied_stages))
+                    
+                    # Find new stages (not copied)
+                    new_stages = []
+                    for stage in stage_columns:
+                        if current_data[stage] and stage not in copied_stages:
+                            new_stages.append({
+                                'stage': stage,
+                                'value': current_data[stage],
+                                'stage_index': stage_to_idx[stage]
+                            })
                     
-                    if stage in copied_stages:
-                        break
+                    branch_patterns[current_run] = {
+                        'type': 'branching_run',
+                        'display_all': False,
+                        'copied_stages': copied_stages,
+                        'new_stages': new_stages,
+                        'last_copied_stage': last_copied_stage
+                    }
             
-            # Determine run type based on copied data
-            if not copied_stages:
-                # No copied data: independent run - display all stages
-                logger.info(f"{current_run}: Independent run - display all stages")
-                branch_patterns[current_run] = {
-                    'type': 'independent_run',
-                    'display_all': True,
-                    'copied_stages': {},
-                    'new_stages': []
-                }
-            else:
-                # Has copied data: branching run
-                logger.info(f"{current_run}: Branching run - copied {len(copied_stages)} stages")
-                
-                # Find new stages (not copied)
-                new_stages = []
-                for stage in stage_columns:
-                    if current_data[stage] and stage not in copied_stages:
-                        new_stages.append({
-                            'stage': stage,
-                            'value': current_data[stage],
-                            'stage_index': stage_columns.index(stage)
-                        })
-                
-                # Find LAST copied stage (highest index)
-                last_copied_stage = None
-                last_copied_index = -1
-                for stage, copy_info in copied_stages.items():
-                    if copy_info['stage_index'] > last_copied_index:
-                        last_copied_index = copy_info['stage_index']
-                        last_copied_stage = copy_info
-                
-                branch_patterns[current_run] = {
-                    'type': 'branching_run',
-                    'display_all': False,
-                    'copied_stages': copied_stages,
-                    'new_stages': new_stages,
-                    'last_copied_stage': last_copied_stage
-                }
+            # Make this run's values available to later runs (earlier runs and stages win)
+            for stage in stage_columns:
+                value = current_data[stage]
+                if value and value not in value_sources:
+                    value_sources[value] = (current_run, stage, stage_to_idx[stage])
         
         return {
             'runs_data': runs_data,
@@ -186,6 +211,23 @@ class SimpleBranchAnalyzer:
             'stage_columns': stage_columns
         }
     
+    def _make_node(self, run_name: str, stage: str, stage_value: str, stage_idx: int,
+                   x_pos: int, y_pos: int, is_branch: bool, style: Dict[str, Any]) -> Dict[str, Any]:
+        """Build one stage node of the layout"""
+        return {
+            'id': f"{run_name}_{stage}",
+            'label': stage_value,
+            'x': x_pos,
+            'y': y_pos,
+            'type': 'stage',
+            'run': run_name,
+            'stage': stage,
+            'stage_index': stage_idx,
+            'value': stage_value,
+            'is_branch': is_branch,
+            'style': style
+        }
+    
     def _generate_layout(self, analysis: Dict[str, Any], stage_columns: List[str], username: str) -> Dict[str, Any]:
         """Generate visualization layout"""
         
@@ -194,8 +236,13 @@ class SimpleBranchAnalyzer:
         sorted_runs = analysis['sorted_runs']
         
         nodes = []
+        node_ids = set()
+        display_all_nodes = {}
         connections = []
         
+        # Furthest node position, tracked while nodes are placed
+        max_node_x = max_node_y = 0
+        
         # Layout settings
         node_width = 120
         node_height = 60
@@ -217,45 +264,59 @@ class SimpleBranchAnalyzer:
                     return color
             return '#34495E'
         
+        # Stage names repeat in every run, so each column's color is worked out once
+        stage_fill = {stage: get_stage_color(stage) for stage in stage_columns}
+        
+        # new_stages is built in stage index order unless a column name repeats
+        has_repeated_stages = len(set(stage_columns)) != len(stage_columns)
+        
+        # Node positions depend only on the stage column and the run row
+        x_by_stage = tuple(100 + (stage_idx * spacing_x) for stage_idx in range(len(stage_columns)))
+        y_by_run = tuple(100 + (run_idx * spacing_y) for run_idx in range(len(sorted_runs)))
+        
+        # Nodes with the same fill and branch state share one read-only style dict
+        node_styles = {}
+        
+        def node_style(fill: str, is_branch: bool) -> Dict[str, Any]:
+            style = node_styles.get((fill, is_branch))
+            if style is None:
+                style = node_styles[(fill, is_branch)] = {
+                    'width': node_width,
+                    'height': node_height,
+                    'fill': fill,
+                    'stroke': '#FFD700' if is_branch else 'white',
+                    'strokeWidth': 3 if is_branch else 2,
+                    'cornerRadius': 8,
+                    'fontSize': 12,
+                    'textColor': 'white',
+                    'fontWeight': 'bold'
+                }
+            return style
+        
         # Generate nodes for each run
         for run_idx, run_name in enumerate(sorted_runs):
             pattern = branch_patterns[run_name]
             run_data = runs_data[run_name]
             
-            base_y = 100 + (run_idx * spacing_y)
+            base_y = y_by_run[run_idx]
             
             if pattern['display_all']:
                 # Display all stages for this run
+                is_branch = pattern['type'] == 'branching_run'
+                run_start = len(nodes)
                 for stage_idx, stage in enumerate(stage_columns):
                     stage_value = run_data[stage]
                     if stage_value:  # Only create nodes for non-empty stages
-                        node_id = f"{run_name}_{stage}"
-                        x_pos = 100 + (stage_idx * spacing_x)
-                        
-                        nodes.append({
-                            'id': node_id,
-                            'label': stage_value,
-                            'x': x_pos,
-                            'y': base_y,
-                            'type': 'stage',
-                            'run': run_name,
-                            'stage': stage,
-                            'stage_name': stage,
-                            'stage_index': stage_idx,
-                            'value': stage_value,
-                            'is_branch': pattern['type'] == 'branching_run',
-                            'style': {
-                                'width': node_width,
-                                'height': node_height,
-                                'fill': get_stage_color(stage),
-                                'stroke': '#FFD700' if pattern['type'] == 'branching_run' else 'white',
-                                'strokeWidth': 3 if pattern['type'] == 'branching_run' else 2,
-                                'cornerRadius': 8,
-                                'fontSize': 12,
-                                'textColor': 'white',
-                                'fontWeight': 'bold'
-                            }
-                        })
+                        node = self._make_node(run_name, stage, stage_value, stage_idx,
+                                               x_by_stage[stage_idx], base_y, is_branch,
+                                               node_style(stage_fill[stage], is_branch))
+                        node_ids.add(node['id'])
+                        max_node_x = max(max_node_x, node['x'])
+                        max_node_y = max(max_node_y, base_y)
+                        nodes.append(node)
+                
+                # Created in stage order, so the linear connections below need no filtering or sorting
+                display_all_nodes[run_name] = nodes[run_start:]
             else:
                 # Branching run: only display NEW stages (skip copied ones)
                 for new_stage in pattern['new_stages']:
@@ -263,44 +324,21 @@ class SimpleBranchAnalyzer:
                     stage_value = new_stage['value']
                     stage_idx = new_stage['stage_index']
                     
-                    node_id = f"{run_name}_{stage}"
-                    x_pos = 100 + (stage_idx * spacing_x)
-                    
-                    nodes.append({
-                        'id': node_id,
-                        'label': stage_value,
-                        'x': x_pos,
-                        'y': base_y,
-                        'type': 'stage',
-                        'run': run_name,
-                        'stage': stage,
-                        'stage_name': stage,
-                        'stage_index': stage_idx,
-                        'value': stage_value,
-                        'is_branch': True,
-                        'style': {
-                            'width': node_width,
-                            'height': node_height,
-                            'fill': get_stage_color(stage),
-                            'stroke': '#FFD700',
-                            'strokeWidth': 3,
-                            'cornerRadius': 8,
-                            'fontSize': 12,
-                            'textColor': 'white',
-                            'fontWeight': 'bold'
-                        }
-                    })
+                    node = self._make_node(run_name, stage, stage_value, stage_idx,
+                                           x_by_stage[stage_idx], base_y, True,
+                                           node_style(stage_fill[stage], True))
+                    node_ids.add(node['id'])
+                    max_node_x = max(max_node_x, node['x'])
+                    max_node_y = max(max_node_y, base_y)
+                    nodes.append(node)
         
         # Generate connections
-        node_dict = {node['id']: node for node in nodes}
-        
         for run_idx, run_name in enumerate(sorted_runs):
             pattern = branch_patterns[run_name]
             
             if pattern['display_all']:
                 # Linear connections within the run
-                run_nodes = [n for n in nodes if n['run'] == run_name]
-                run_nodes.sort(key=lambda x: x['stage_index'])
+                run_nodes = display_all_nodes[run_name]
                 
                 for i in range(len(run_nodes) - 1):
                     connections.append({
@@ -318,6 +356,8 @@ class SimpleBranchAnalyzer:
                 # Branching run: create branch connection from LAST copied stage to FIRST new stage
                 last_copied = pattern['last_copied_stage']
                 new_stages = pattern['new_stages']
+                if has_repeated_stages:
+                    new_stages.sort(key=lambda x: x['stage_index'])
                 
                 if last_copied and new_stages:
                     # Source node (last copied stage)
@@ -326,11 +366,11 @@ class SimpleBranchAnalyzer:
                     source_node_id = f"{source_run}_{source_stage}"
                     
                     # Target node (first new stage)
-                    first_new_stage = min(new_stages, key=lambda x: x['stage_index'])
+                    first_new_stage = new_stages[0]
                     target_node_id = f"{run_name}_{first_new_stage['stage']}"
                     
                     # Create branch connection
-                    if source_node_id in node_dict and target_node_id in node_dict:
+                    if source_node_id in node_ids and target_node_id in node_ids:
                         connections.append({
                             'from': source_node_id,
                             'to': target_node_id,
@@ -343,11 +383,10 @@ class SimpleBranchAnalyzer:
                                 'strokeDasharray': '8,4'
                             }
                         })
-                        logger.info(f"Branch connection: {source_node_id} -> {target_node_id}")
+                        logger.debug("Branch connection: %s -> %s", source_node_id, target_node_id)
                 
                 # Linear connections within new stages
                 if len(new_stages) > 1:
-                    new_stages.sort(key=lambda x: x['stage_index'])
                     for i in range(len(new_stages) - 1):
                         from_id = f"{run_name}_{new_stages[i]['stage']}"
                         to_id = f"{run_name}_{new_stages[i + 1]['stage']}"
@@ -365,8 +404,8 @@ class SimpleBranchAnalyzer:
                         })
         
         # Calculate layout dimensions
-        max_x = max([n['x'] for n in nodes]) + node_width + 100 if nodes else 800
-        max_y = max([n['y'] for n in nodes]) + node_height + 100 if nodes else 600
+        max_x = max_node_x + node_width + 100 if nodes else 800
+        max_y = max_node_y + node_height + 100 if nodes else 600
         
         return {
             'nodes': nodes,
@@ -391,15 +430,16 @@ class SimpleBranchAnalyzer:
             }
         }
 
-def analyze_branch_view(file_path: str) -> Dict[str, Any]:
-    """Main function to analyze branch view"""
+def analyze_branch_view(file_path: Union[str, BinaryIO]) -> Dict[str, Any]:
+    """Main function to analyze branch view (accepts a path or binary file-like)"""
     analyzer = SimpleBranchAnalyzer()
     return analyzer.analyze_csv(file_path)
 
 if __name__ == "__main__":
-    import sys
+    logging.basicConfig(level=logging.INFO)
     if len(sys.argv) > 1:
         result = analyze_branch_view(sys.argv[1])
+        # ASCII escaping is kept so callers that decode stdout per chunk never split a character
         print(json.dumps(result, indent=2))
     else:
         print("Usage: python simple_branch_analyzer.py <csv_file>")
\ No newline at end of file